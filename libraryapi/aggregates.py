@@ -0,0 +1,75 @@
+"""
+Per-author stats over their books (AuthorAggregate).
+
+Each refresh recomputes the rows of the given authors from the book join
+in one ``INSERT ... SELECT ... ON CONFLICT DO UPDATE``, so the stored
+values are always exact rather than adjusted by deltas. The signal
+handlers in libraryapi.signals refresh the authors of every book that is
+saved, deleted or relinked; ``manage.py refresh_author_aggregates``
+rebuilds everything.
+"""
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .cache import invalidate
+from .models import Author, AuthorAggregate, Book
+
+_REFRESH_SQL = """
+INSERT INTO {aggregate} (author_id, book_count, ratings_count, text_reviews_count, average_rating, updated_at)
+SELECT
+    a.id,
+    count(b.id),
+    coalesce(sum(b.ratings_count), 0),
+    coalesce(sum(b.text_reviews_count), 0),
+    coalesce(round(sum(b.average_rating * b.ratings_count) / nullif(sum(b.ratings_count), 0), 2), 0),
+    now()
+FROM {author} a
+LEFT JOIN {through} ba ON ba.author_id = a.id
+LEFT JOIN {book} b ON b.id = ba.book_id
+WHERE {where}
+GROUP BY a.id
+ON CONFLICT (author_id) DO UPDATE SET
+    book_count = EXCLUDED.book_count,
+    ratings_count = EXCLUDED.ratings_count,
+    text_reviews_count = EXCLUDED.text_reviews_count,
+    average_rating = EXCLUDED.average_rating,
+    updated_at = EXCLUDED.updated_at
+"""
+
+
+def _refresh(where, params, using=DEFAULT_DB_ALIAS):
+    db = connections[using]
+    qn = db.ops.quote_name
+    sql = _REFRESH_SQL.format(
+        aggregate=qn(AuthorAggregate._meta.db_table),
+        author=qn(Author._meta.db_table),
+        through=qn(Book.authors.through._meta.db_table),
+        book=qn(Book._meta.db_table),
+        where=where,
+    )
+    with db.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
+
+
+def refresh_author_aggregates(author_ids, using=DEFAULT_DB_ALIAS):
+    author_ids = sorted({int(author_id) for author_id in author_ids})
+    if not author_ids:
+        return 0
+    refreshed = _refresh('a.id = ANY(%(author_ids)s)', {'author_ids': author_ids}, using)
+    invalidate('author', author_ids, using=using)
+    return refreshed
+
+
+def refresh_book_author_aggregates(book_ids, using=DEFAULT_DB_ALIAS):
+    """Refresh every author currently linked to one of ``book_ids``."""
+    book_ids = [int(book_id) for book_id in book_ids]
+    if not book_ids:
+        return 0
+    through = Book.authors.through
+    author_ids = through.objects.using(using).filter(book_id__in=book_ids).values_list('author_id', flat=True)
+    return refresh_author_aggregates(author_ids, using)
+
+
+def refresh_author_range(start_id, end_id, using=DEFAULT_DB_ALIAS):
+    """Refresh authors with ``start_id <= id < end_id`` (used for full rebuilds)."""
+    return _refresh('a.id >= %(start)s AND a.id < %(end)s', {'start': start_id, 'end': end_id}, using)
@@ -0,0 +1,129 @@
+"""
+Async versions of the read endpoints, for serving under ASGI
+(libraryassessment.asgi).
+
+They answer the same queries as BookViewSet.list/retrieve (including
+?search=) and RecommendationView, reusing their filters, paginators and
+serializers, but read through the async ORM so a request waiting on
+Postgres doesn't hold a worker thread. Query embedding is CPU-bound and
+runs in a small thread pool; similarity and hybrid search queries (which
+need a transaction for the ANN settings) go through sync_to_async.
+
+The response cache (libraryapi.cache) is not used here.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Prefetch
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import APIException, NotAuthenticated, ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .filters import BookFilterBackend, get_book_ordering
+from .models import Author, Book, UserFavorite, UserTasteProfile
+from .pagination import KeysetPagination, RankedResultsPagination, estimate_count
+from .search import embed_query, hybrid_search, search_books
+from .serializers import BookListSerializer, BookSerializer
+from .similarity import nearest_books
+from .views import get_limit_offset
+
+_embedding_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'ASYNC_EMBEDDING_WORKERS', 2), thread_name_prefix='async-embed',
+)
+
+# Stands in for the viewset where the filter backend and paginator expect one
+_list_view = SimpleNamespace(action='list', get_keyset_ordering=get_book_ordering)
+
+
+def _json(data, status=200, headers=None):
+    # DRF's renderer handles dates, decimals and numpy vectors like the sync views
+    return HttpResponse(JSONRenderer().render(data), status=status, content_type='application/json', headers=headers)
+
+
+def _error(exc):
+    detail = exc.detail if isinstance(exc.detail, (dict, list)) else {'detail': exc.detail}
+    return _json(detail, status=exc.status_code)
+
+
+async def _search(drf_request, queryset, text):
+    mode = drf_request.query_params.get('mode', 'lexical')
+    timings = {}
+    if mode == 'hybrid':
+        started = time.perf_counter()
+        query_vector = await asyncio.get_running_loop().run_in_executor(_embedding_executor, embed_query, text)
+        embed_ms = (time.perf_counter() - started) * 1000
+        queryset, timings = await sync_to_async(hybrid_search)(queryset, text, query_vector=query_vector)
+        timings = dict(embed=embed_ms, **timings)
+    elif mode == 'lexical':
+        queryset = search_books(queryset, text)
+    else:
+        raise ValidationError({'mode': "Expected 'lexical' or 'hybrid'."})
+    return queryset, timings
+
+
+@require_GET
+async def book_list(request):
+    drf_request = Request(request)
+    queryset = Book.objects.defer('vector', 'description', 'search_vector').prefetch_related(
+        Prefetch('authors', queryset=Author.objects.only('id', 'name'))
+    )
+    try:
+        text = drf_request.query_params.get('search')
+        timings = {}
+        if text:
+            queryset, timings = await _search(drf_request, queryset, text)
+            paginator = RankedResultsPagination()
+        else:
+            paginator = KeysetPagination()
+            paginator.count_estimate = None
+        queryset = BookFilterBackend().filter_queryset(drf_request, queryset, _list_view)
+
+        if not text and drf_request.query_params.get(paginator.count_query_param) == 'estimate':
+            paginator.count_estimate = await sync_to_async(estimate_count)(queryset)
+        rows = paginator.set_page([book async for book in paginator.page_queryset(queryset, drf_request, _list_view)])
+    except APIException as exc:
+        return _error(exc)
+
+    data = BookListSerializer(rows, many=True, context={'request': drf_request}).data
+    headers = None
+    if timings:
+        headers = {'Server-Timing': ', '.join(f'{stage};dur={ms:.1f}' for stage, ms in timings.items())}
+    return _json(paginator.get_paginated_response(data).data, headers=headers)
+
+
+@require_GET
+async def book_detail(request, pk):
+    book = await Book.objects.defer('search_vector').prefetch_related('authors').filter(pk=pk).afirst()
+    if book is None:
+        return _json({'detail': 'No Book matches the given query.'}, status=404)
+    return _json(BookSerializer(book, context={'request': Request(request)}).data)
+
+
+@require_GET
+async def recommendations(request):
+    drf_request = Request(request, authenticators=[JWTAuthentication()])
+    try:
+        # Token validation is cheap but the user lookup is a query
+        user = await sync_to_async(lambda: drf_request.user)()
+        if not user.is_authenticated:
+            raise NotAuthenticated()
+        limit, offset = get_limit_offset(drf_request)
+    except APIException as exc:
+        return _error(exc)
+
+    profile = await UserTasteProfile.objects.filter(user=user).afirst()
+    if profile is None or profile.vector is None:
+        return _json({'limit': limit, 'offset': offset, 'results': []})
+
+    favorite_books = [book_id async for book_id in UserFavorite.objects.filter(user=user).values_list('book', flat=True)]
+    recommended_books = await sync_to_async(nearest_books)(
+        profile.vector, exclude_ids=favorite_books, limit=limit, offset=offset,
+    )
+    return _json({'limit': limit, 'offset': offset, 'results': recommended_books})
@@ -0,0 +1,197 @@
+"""
+Batch create/update of books (POST and PATCH /api/books/bulk/).
+
+Every item is validated on its own and gets its own entry in the results,
+so one bad item doesn't fail the batch. The valid ones are then handled
+together: author ids are checked with one query, the books whose title or
+description changed are embedded with one batched encode, and everything
+is written with bulk_create/bulk_update plus one bulk insert of author
+links in a single transaction. books_bulk_saved refreshes search vectors,
+author aggregates and the response cache for the batch.
+
+If the model can't encode, the books are saved as pending and left to
+libraryapi.embedding_queue instead.
+"""
+import logging
+
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.relations import PrimaryKeyRelatedField
+
+from .embedding_queue import embedding_queue
+from .models import Author, Book
+from .serializers import BookBulkSerializer
+from .signals import book_vectors_saved, books_bulk_saved
+from .utils import content_hash, vectorizer
+
+logger = logging.getLogger(__name__)
+
+_VECTOR_FIELDS = ['vector', 'content_hash', 'vector_model', 'vector_status']
+
+
+def _error(index, errors, book_id=None):
+    result = {'index': index, 'status': 'error', 'errors': errors}
+    if book_id is not None:
+        result['id'] = book_id
+    return result
+
+
+def _check_authors(valid, results):
+    """Drop ``(index, data, book)`` items naming unknown authors; one query for the batch."""
+    referenced = {author_id for _, data, _ in valid for author_id in data.get('authors', ())}
+    known = set(Author.objects.filter(id__in=referenced).values_list('id', flat=True))
+    message = PrimaryKeyRelatedField.default_error_messages['does_not_exist']
+    checked = []
+    for index, data, book in valid:
+        unknown = [author_id for author_id in data.get('authors', ()) if author_id not in known]
+        if unknown:
+            results[index] = _error(
+                index, {'authors': [message.format(pk_value=unknown[0])]}, book.pk if book else None,
+            )
+        else:
+            checked.append((index, data, book))
+    return checked
+
+
+def _embed(books):
+    """Set vector fields on ``books`` in place; returns the ones that got a vector."""
+    if not books:
+        return []
+    try:
+        vectors = vectorizer.generate_vectors([book.title for book in books], [book.description for book in books])
+    except Exception:
+        logger.exception('Batch embedding failed; queueing %s books instead', len(books))
+        for book in books:
+            book.vector_status = Book.VECTOR_PENDING
+        return []
+    for book, vector in zip(books, vectors):
+        book.vector = vector
+        book.content_hash = content_hash(book.title, book.description)
+        book.vector_model = vectorizer.model_name
+        book.vector_status = Book.VECTOR_READY
+    return books
+
+
+def _after_commit(embedded, pending):
+    def send():
+        if pending:
+            embedding_queue.enqueue([book.pk for book in pending])
+        if embedded:
+            book_vectors_saved.send(
+                sender=Book, book_ids=[book.pk for book in embedded], vectors=[book.vector for book in embedded],
+            )
+    transaction.on_commit(send)
+
+
+def _link_authors(books_and_authors, replace=False):
+    """Link the books to their authors; returns the ids of authors that lost a book when replacing."""
+    BookAuthor = Book.authors.through
+    previous = []
+    if replace:
+        links = BookAuthor.objects.filter(book_id__in=[book.pk for book, _ in books_and_authors])
+        previous = list(links.values_list('author_id', flat=True).distinct())
+        links.delete()
+    BookAuthor.objects.bulk_create(
+        [
+            BookAuthor(book_id=book.pk, author_id=author_id)
+            for book, author_ids in books_and_authors
+            for author_id in dict.fromkeys(author_ids)
+        ],
+        ignore_conflicts=True,
+    )
+    return previous
+
+
+def bulk_create_books(items):
+    """Create books from ``items`` (dicts); returns one result per item, in order."""
+    results = [None] * len(items)
+    valid = []
+    for index, item in enumerate(items):
+        serializer = BookBulkSerializer(data=item)
+        if serializer.is_valid():
+            valid.append((index, dict(serializer.validated_data), None))
+        else:
+            results[index] = _error(index, serializer.errors)
+    valid = _check_authors(valid, results)
+
+    if not valid:
+        return results
+    books = []
+    for _, data, _ in valid:
+        author_ids = data.pop('authors')
+        books.append((Book(**data), author_ids))
+    embedded = _embed([book for book, _ in books])
+
+    with transaction.atomic():
+        Book.objects.bulk_create([book for book, _ in books])
+        _link_authors(books)
+        books_bulk_saved.send(sender=Book, book_ids=[book.pk for book, _ in books])
+        # Created books only have ids once inserted, so failed embeddings are queued here
+        _after_commit(embedded, [book for book, _ in books if book.vector_status == Book.VECTOR_PENDING])
+
+    for (index, _, _), (book, _) in zip(valid, books):
+        results[index] = {'index': index, 'id': book.pk, 'status': 'created', 'vector_status': book.vector_status}
+    return results
+
+
+def bulk_update_books(items):
+    """
+    Partially update books from ``items``, each with an ``id``; returns one
+    result per item, in order. ``authors``, when given, replaces the links.
+    """
+    results = [None] * len(items)
+    ids = {}
+    for index, item in enumerate(items):
+        book_id = item.get('id') if isinstance(item, dict) else None
+        if not isinstance(book_id, int) or isinstance(book_id, bool):
+            results[index] = _error(index, {'id': ['An integer id is required.']})
+        elif book_id in ids:
+            results[index] = _error(index, {'id': ['Duplicate id in this batch.']}, book_id)
+        else:
+            ids[book_id] = index
+    instances = Book.objects.defer('search_vector').in_bulk(list(ids))
+
+    valid = []
+    for book_id, index in ids.items():
+        book = instances.get(book_id)
+        if book is None:
+            results[index] = _error(index, {'id': ['Not found.']}, book_id)
+            continue
+        serializer = BookBulkSerializer(book, data=items[index], partial=True)
+        if serializer.is_valid():
+            valid.append((index, dict(serializer.validated_data), book))
+        else:
+            results[index] = _error(index, serializer.errors, book_id)
+    valid = _check_authors(valid, results)
+
+    fields = {'updated_at'}
+    stale = []
+    relinks = []
+    now = timezone.now()
+    for _, data, book in valid:
+        author_ids = data.pop('authors', None)
+        if author_ids is not None:
+            relinks.append((book, author_ids))
+        for name, value in data.items():
+            setattr(book, name, value)
+        fields.update(data)
+        book.updated_at = now
+        # Only re-embed what the embedding depends on
+        if book.vector is None or content_hash(book.title, book.description) != book.content_hash:
+            stale.append(book)
+    embedded = _embed(stale)
+    if stale:
+        fields.update(_VECTOR_FIELDS)
+
+    if not valid:
+        return results
+    books = [book for _, _, book in valid]
+    with transaction.atomic():
+        Book.objects.bulk_update(books, sorted(fields))
+        unlinked = _link_authors(relinks, replace=True) if relinks else []
+        books_bulk_saved.send(sender=Book, book_ids=[book.pk for book in books], author_ids=unlinked)
+        _after_commit(embedded, [book for book in stale if book.vector_status == Book.VECTOR_PENDING])
+
+    for index, _, book in valid:
+        results[index] = {'index': index, 'id': book.pk, 'status': 'updated', 'vector_status': book.vector_status}
+    return results
@@ -0,0 +1,146 @@
+"""
+Response cache for the public book and author read endpoints.
+
+Cached responses are keyed by a version token per object (detail pages)
+and per namespace (list pages). Writes never delete cache entries; the
+signal handlers in libraryapi.signals bump the version instead, so every
+key built from the old token simply stops being read. The same token
+doubles as the ETag, which lets clients revalidate with a 304 without the
+request touching Postgres at all.
+
+Versions are bumped once the writing transaction commits, so a read that
+races the write can't cache the old row under the new token.
+
+The storage is whatever Django cache is configured under
+settings.RESPONSE_CACHE['ALIAS']. Bumps only reach readers that share that
+cache. With RESPONSE_CACHE['SHARED'] set (the default with the Redis
+backend) bodies are kept for TIMEOUT seconds. With the per-process
+LocMemCache a write bumps only its own worker's tokens; other workers and
+management commands can't reach the rest. Bodies are then kept for
+LOCAL_TIMEOUT seconds only, which bounds how stale another worker can be.
+The ETag is then a hash of the body rather than the token, so a 304 is
+never given for a stale page.
+"""
+import hashlib
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+KEY_PREFIX = 'rc'
+
+
+def _setting(name, default):
+    return getattr(settings, 'RESPONSE_CACHE', {}).get(name, default)
+
+
+def _cache():
+    return caches[_setting('ALIAS', 'default')]
+
+
+def _version_key(namespace, pk=None):
+    return f"{KEY_PREFIX}:v:{namespace}:{'list' if pk is None else pk}"
+
+
+def get_version(namespace, pk=None):
+    """Current ``(token, modified_timestamp)`` for a namespace or object."""
+    key = _version_key(namespace, pk)
+    version = _cache().get(key)
+    if version is None:
+        # add() so that concurrent first readers agree on one token
+        _cache().add(key, (uuid.uuid4().hex, int(time.time())), None)
+        version = _cache().get(key)
+    return version
+
+
+def bump_version(namespace, pk=None):
+    _cache().set(_version_key(namespace, pk), (uuid.uuid4().hex, int(time.time())), None)
+
+
+def invalidate(namespace, pks=(), using=None):
+    """
+    Invalidate the given objects' detail pages and every list page of the
+    namespace once the current transaction on ``using`` commits (at once
+    outside a transaction).
+    """
+    pks = list(pks)
+
+    def bump():
+        for pk in pks:
+            bump_version(namespace, pk)
+        bump_version(namespace)
+    transaction.on_commit(bump, using=using)
+
+
+class CachedResponseMixin:
+    """
+    Serves ``list`` and ``retrieve`` from the response cache, with ETag and
+    Last-Modified headers and conditional 304 responses.
+    """
+    cache_namespace = None
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, None, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        object_pk = kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        return self.cached_response(request, object_pk, super().retrieve, *args, **kwargs)
+
+    def cached_data(self, request, digest, timeout, render, *args, **kwargs):
+        """``(data, response)``: the cached body, or else the freshly rendered response."""
+        key = f'{KEY_PREFIX}:{self.cache_namespace}:{digest}'
+        data = _cache().get(key)
+        if data is not None:
+            return data, None
+        response = render(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            _cache().set(key, response.data, timeout)
+        return response.data, response
+
+    def cached_response(self, request, object_pk, render, *args, **kwargs):
+        token, modified = get_version(self.cache_namespace, object_pk)
+        url = request.build_absolute_uri()
+        digest = hashlib.sha1(f'{token}:{url}:{request.accepted_media_type}'.encode()).hexdigest()
+        if not _setting('SHARED', False):
+            return self.local_response(request, digest, render, *args, **kwargs)
+        etag = f'"{digest}"'
+
+        if_none_match = request.headers.get('If-None-Match')
+        if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+        if (if_none_match and etag in [tag.strip() for tag in if_none_match.split(',')]) or (
+            if_none_match is None and if_modified_since is not None and modified <= if_modified_since
+        ):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            data, response = self.cached_data(request, digest, _setting('TIMEOUT', 300), render, *args, **kwargs)
+            if response is None:
+                response = Response(data)
+
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(modified)
+            # Clients may keep a copy but must revalidate it every time
+            response['Cache-Control'] = 'public, no-cache'
+        return response
+
+    def local_response(self, request, digest, render, *args, **kwargs):
+        # This worker's tokens miss other processes' writes: keep bodies briefly and tag the body itself
+        data, response = self.cached_data(request, digest, _setting('LOCAL_TIMEOUT', 5), render, *args, **kwargs)
+        if response is None:
+            response = Response(data)
+        elif response.status_code != status.HTTP_200_OK:
+            return response
+        body = JSONRenderer().render(data)
+        etag = f'"{hashlib.sha1(body + request.accepted_media_type.encode()).hexdigest()}"'
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match and etag in [tag.strip() for tag in if_none_match.split(',')]:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'public, no-cache'
+        return response
@@ -0,0 +1,171 @@
+"""
+Background embedding of books written through the API.
+
+Book writes save immediately with ``vector_status='pending'`` and hand the
+book id to the queue once the transaction commits. Worker threads drain the
+queue in batches: they read the current title and description, encode the
+whole batch in one call and write the vectors back with a single
+bulk_update.
+
+The queue lives in the web process, so jobs still queued when the process
+exits are lost; those books stay ``pending`` and ``manage.py embed_pending``
+picks them up.
+"""
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import BooleanField, ExpressionWrapper, Q
+from django.utils import timezone
+
+from .cache import invalidate
+from .models import Book
+from .signals import book_vectors_saved
+from .utils import BookVectorizer, ContentHash, content_hash, vectorizer
+
+logger = logging.getLogger(__name__)
+
+
+def _queue_setting(name, default):
+    return getattr(settings, 'EMBEDDING_QUEUE', {}).get(name, default)
+
+
+def stale_vectors_q(model_name):
+    """Books whose vector is missing, from another model or for older text."""
+    return (
+        Q(vector__isnull=True)
+        | ~Q(vector_model=model_name)
+        | ~Q(content_hash=ContentHash())
+    )
+
+
+def embed_books(book_ids, model_name=None):
+    """
+    Embed and store vectors for ``book_ids``; returns the number written.
+
+    Books whose vector already matches their content and ``model_name`` are
+    only marked ready. Rows are re-checked under a row lock before writing,
+    so a concurrent edit is never overwritten with a vector for the old text
+    (its own queued job embeds it); locked rows are skipped. Failures mark
+    the batch ``failed`` and re-raise.
+    """
+    model_name = model_name or vectorizer.model_name
+    encoder = vectorizer if model_name == vectorizer.model_name else BookVectorizer(model_name)
+    books = list(
+        Book.objects.filter(id__in=book_ids)
+        .annotate(is_stale=ExpressionWrapper(stale_vectors_q(model_name), output_field=BooleanField()))
+        .only('id', 'title', 'description')
+    )
+    stale = [book for book in books if book.is_stale]
+    fresh_ids = [book.id for book in books if not book.is_stale]
+
+    written = []
+    try:
+        if stale:
+            vectors = encoder.generate_vectors(
+                [book.title for book in stale],
+                [book.description for book in stale],
+                batch_size=_queue_setting('BATCH_SIZE', 32),
+            )
+            with transaction.atomic():
+                current = {
+                    book.id: content_hash(book.title, book.description)
+                    for book in Book.objects.select_for_update(skip_locked=True)
+                    .filter(id__in=[book.id for book in stale]).only('id', 'title', 'description')
+                }
+                for book, vector in zip(stale, vectors):
+                    digest = content_hash(book.title, book.description)
+                    if current.get(book.id) != digest:
+                        continue
+                    book.vector = vector
+                    book.content_hash = digest
+                    book.vector_model = model_name
+                    book.vector_status = Book.VECTOR_READY
+                    written.append(book)
+                # bulk_update skips auto_now; exports pick vector changes up by updated_at
+                now = timezone.now()
+                for book in written:
+                    book.updated_at = now
+                Book.objects.bulk_update(
+                    written, ['vector', 'content_hash', 'vector_model', 'vector_status', 'updated_at'],
+                )
+        if fresh_ids:
+            Book.objects.filter(id__in=fresh_ids).exclude(vector_status=Book.VECTOR_READY).update(
+                vector_status=Book.VECTOR_READY
+            )
+    except Exception:
+        Book.objects.filter(id__in=[book.id for book in stale]).update(vector_status=Book.VECTOR_FAILED)
+        raise
+    finally:
+        invalidate('book', [book.id for book in books])
+    if written:
+        book_vectors_saved.send(
+            sender=Book, book_ids=[book.id for book in written], vectors=[book.vector for book in written],
+        )
+    return len(written)
+
+
+class EmbeddingQueue:
+    """
+    In-process queue of book ids served by a small pool of daemon threads.
+
+    Each worker blocks for one id, then keeps collecting for up to
+    ``max_wait`` seconds or until it has ``batch_size`` ids, so a burst of
+    writes becomes one encode call. Threads start on the first enqueue,
+    which keeps them out of management commands and pre-fork masters.
+    """
+
+    def __init__(self, workers=None, batch_size=None, max_wait=None):
+        self.workers = workers or _queue_setting('WORKERS', 1)
+        self.batch_size = batch_size or _queue_setting('BATCH_SIZE', 32)
+        self.max_wait = max_wait if max_wait is not None else _queue_setting('MAX_WAIT_MS', 50) / 1000
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def enqueue(self, book_ids):
+        self._start()
+        for book_id in book_ids:
+            self._queue.put(book_id)
+
+    def enqueue_on_commit(self, book_ids, using=None):
+        # Workers must not look at the rows before the writing transaction commits
+        book_ids = list(book_ids)
+        transaction.on_commit(lambda: self.enqueue(book_ids), using=using)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f'embedding-worker-{index}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _next_batch(self):
+        batch = {self._queue.get()}
+        while len(batch) < self.batch_size:
+            try:
+                batch.add(self._queue.get(timeout=self.max_wait))
+            except queue.Empty:
+                break
+        return list(batch)
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                embed_books(batch)
+            except Exception:
+                logger.exception('Embedding failed for books %s', batch)
+            finally:
+                # Worker threads get their own connection; don't keep it open between bursts
+                connection.close()
+
+
+embedding_queue = EmbeddingQueue()
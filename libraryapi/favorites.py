@@ -0,0 +1,147 @@
+"""
+Favorites write path.
+
+Every change to a user's favorites first locks their UserTasteProfile row,
+so changes for one user apply one at a time and the profile's
+favorite_count is an exact, race-free count to enforce MAX_FAVORITES
+against. The favorites themselves are written with a single statement per
+call: an ``INSERT ... ON CONFLICT DO NOTHING`` in a CTE that also returns
+the vectors of the added books, which are folded into the profile's running
+mean, or a ``DELETE`` in a CTE that returns the vectors of the favorites
+left, which the mean is rebuilt from.
+
+Books are re-embedded after edits and model changes, so the profiles of
+everyone who favorited them are rebuilt on book_vectors_saved as well
+(rebuild_profiles).
+"""
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Book, UserFavorite, UserTasteProfile
+
+MAX_FAVORITES = 20
+
+_ADD_SQL = """
+WITH requested AS (
+    SELECT b.id, b.vector FROM {book} b WHERE b.id = ANY(%(book_ids)s)
+), added AS (
+    INSERT INTO {favorite} (user_id, book_id, added_on)
+    SELECT %(user_id)s, r.id, now() FROM requested r ORDER BY r.id
+    ON CONFLICT (user_id, book_id) DO NOTHING
+    RETURNING book_id
+)
+SELECT r.id, r.vector, a.book_id IS NOT NULL FROM requested r LEFT JOIN added a ON a.book_id = r.id
+"""
+
+# The main query still sees the favorites as they were before the DELETE
+_REMOVE_SQL = """
+WITH removed AS (
+    DELETE FROM {favorite} WHERE user_id = %(user_id)s AND book_id = ANY(%(book_ids)s)
+    RETURNING book_id
+)
+SELECT f.book_id, b.vector, r.book_id IS NOT NULL
+FROM {favorite} f
+JOIN {book} b ON b.id = f.book_id
+LEFT JOIN removed r ON r.book_id = f.book_id
+WHERE f.user_id = %(user_id)s
+"""
+
+# Profiles rebuilt per transaction by rebuild_profiles
+REBUILD_BATCH_SIZE = 500
+
+
+class FavoriteLimitExceeded(Exception):
+    pass
+
+
+def _sql(template):
+    qn = connection.ops.quote_name
+    return template.format(book=qn(Book._meta.db_table), favorite=qn(UserFavorite._meta.db_table))
+
+
+def locked_profile(user):
+    """The user's taste profile, locked until the end of the transaction."""
+    profile, _ = UserTasteProfile.objects.select_for_update().get_or_create(user=user)
+    return profile
+
+
+def add_favorites(user, book_ids):
+    """
+    Add ``book_ids`` to the user's favorites.
+
+    Returns ``(profile, added, existing, missing)``: the updated profile and
+    the ids that were added, were already favorites and don't exist.
+    Raises FavoriteLimitExceeded, adding nothing, if the new favorites would
+    take the user over MAX_FAVORITES.
+    """
+    book_ids = list(dict.fromkeys(int(book_id) for book_id in book_ids))
+    vector_field = Book._meta.get_field('vector')
+    with transaction.atomic():
+        profile = locked_profile(user)
+        with connection.cursor() as cursor:
+            cursor.execute(_sql(_ADD_SQL), {'user_id': user.pk, 'book_ids': book_ids})
+            rows = cursor.fetchall()
+
+        added = [(book_id, vector) for book_id, vector, inserted in rows if inserted]
+        if profile.favorite_count + len(added) > MAX_FAVORITES:
+            # Leaving the block through the exception rolls the insert back
+            raise FavoriteLimitExceeded(f'You can only have a maximum of {MAX_FAVORITES} favorite books.')
+
+        for _, vector in added:
+            profile.add_favorite(vector_field.from_db_value(vector, None, connection))
+        if added:
+            profile.save()
+
+    found = {book_id for book_id, _, _ in rows}
+    added_ids = {book_id for book_id, _ in added}
+    return (
+        profile,
+        [book_id for book_id in book_ids if book_id in added_ids],
+        [book_id for book_id in book_ids if book_id in found and book_id not in added_ids],
+        [book_id for book_id in book_ids if book_id not in found],
+    )
+
+
+def remove_favorites(user, book_ids):
+    """
+    Remove ``book_ids`` from the user's favorites.
+
+    Returns ``(profile, removed)``; ids that weren't favorites are ignored.
+    """
+    book_ids = list(dict.fromkeys(int(book_id) for book_id in book_ids))
+    vector_field = Book._meta.get_field('vector')
+    with transaction.atomic():
+        profile = locked_profile(user)
+        with connection.cursor() as cursor:
+            cursor.execute(_sql(_REMOVE_SQL), {'user_id': user.pk, 'book_ids': book_ids})
+            rows = cursor.fetchall()
+
+        removed_ids = {book_id for book_id, _, removed in rows if removed}
+        if removed_ids:
+            profile.remove_favorite([
+                vector_field.from_db_value(vector, None, connection) for _, vector, removed in rows if not removed
+            ])
+            profile.save()
+
+    return profile, [book_id for book_id in book_ids if book_id in removed_ids]
+
+
+def rebuild_profiles(user_ids):
+    """Recompute the taste profiles of ``user_ids`` from their favorites' current vectors."""
+    user_ids = sorted(set(user_ids))
+    for start in range(0, len(user_ids), REBUILD_BATCH_SIZE):
+        batch = user_ids[start:start + REBUILD_BATCH_SIZE]
+        with transaction.atomic():
+            # Locked in user order so concurrent rebuilds can't deadlock
+            profiles = list(UserTasteProfile.objects.select_for_update().filter(user_id__in=batch).order_by('user_id'))
+            vectors = {profile.user_id: [] for profile in profiles}
+            for user_id, vector in UserFavorite.objects.filter(user_id__in=list(vectors)).values_list(
+                'user_id', 'book__vector',
+            ):
+                vectors[user_id].append(vector)
+            now = timezone.now()
+            for profile in profiles:
+                profile.rebuild(vectors[profile.user_id])
+                # bulk_update skips auto_now
+                profile.updated_on = now
+            UserTasteProfile.objects.bulk_update(profiles, ['vector', 'favorite_count', 'vector_count', 'updated_on'])
@@ -0,0 +1,131 @@
+"""
+Query-string filtering and ordering for the book list.
+
+Only combinations that one of the Book indexes can answer are accepted:
+the equality filters must be exactly the leading columns of an index and
+the ordering column must be the next one, with any range filter on that
+same column. Anything else is rejected with a 400 rather than silently
+running a sequential scan or a big sort.
+"""
+from django.core.exceptions import ValidationError as DjangoValidationError
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+# query parameter -> (field, lookup)
+BOOK_FILTERS = {
+    'language': ('language', 'exact'),
+    'publisher': ('publisher', 'exact'),
+    'format': ('format', 'exact'),
+    'average_rating__gte': ('average_rating', 'gte'),
+    'average_rating__lte': ('average_rating', 'lte'),
+    'ratings_count': ('ratings_count', 'exact'),
+    'ratings_count__gte': ('ratings_count', 'gte'),
+    'ratings_count__lte': ('ratings_count', 'lte'),
+    'publication_date__gte': ('publication_date', 'gte'),
+    'publication_date__lte': ('publication_date', 'lte'),
+}
+
+# Columns that are only ever compared for equality and can lead an index
+EQUALITY_FIELDS = {'language', 'publisher', 'format'}
+
+# ?ordering= value -> keyset ordering; id breaks ties
+BOOK_ORDERINGS = {
+    'id': ('id',),
+    '-id': ('-id',),
+    'ratings_count': ('ratings_count', 'id'),
+    '-ratings_count': ('-ratings_count', '-id'),
+    'average_rating': ('average_rating', 'id'),
+    '-average_rating': ('-average_rating', '-id'),
+    'publication_date': ('publication_date', 'id'),
+    '-publication_date': ('-publication_date', '-id'),
+}
+
+# (equality columns, order column) pairs served by an index on Book, see
+# Book.Meta.indexes. Range filters are only allowed on the order column.
+INDEXED_COMBINATIONS = {
+    (frozenset(), 'id'),
+    (frozenset(), 'ratings_count'),
+    (frozenset(), 'average_rating'),
+    (frozenset(), 'publication_date'),
+    (frozenset({'language'}), 'id'),
+    (frozenset({'language'}), 'average_rating'),
+    (frozenset({'language'}), 'ratings_count'),
+    (frozenset({'language'}), 'publication_date'),
+    (frozenset({'publisher'}), 'id'),
+    (frozenset({'publisher'}), 'publication_date'),
+    (frozenset({'format'}), 'id'),
+    (frozenset({'format'}), 'ratings_count'),
+}
+
+
+def get_book_ordering(request):
+    ordering = request.query_params.get('ordering')
+    if ordering is None:
+        # Range filters are served by an index on that column, so order by it
+        range_columns = {
+            field_name for param, (field_name, lookup) in BOOK_FILTERS.items()
+            if field_name not in EQUALITY_FIELDS and request.query_params.get(param)
+        }
+        ordering = f'-{range_columns.pop()}' if len(range_columns) == 1 else '-id'
+    if ordering not in BOOK_ORDERINGS:
+        raise ValidationError({'ordering': f"Expected one of {', '.join(BOOK_ORDERINGS)}."})
+    return BOOK_ORDERINGS[ordering]
+
+
+def non_null_ordering_filters(model, ordering):
+    """``<column>__isnull=False`` for each nullable column of a keyset ordering."""
+    # A NULL key can't go into a cursor or be compared with lt/gt
+    return {
+        f"{field.lstrip('-')}__isnull": False
+        for field in ordering if model._meta.get_field(field.lstrip('-')).null
+    }
+
+
+def _describe(combination):
+    equality, column = combination
+    return ' + '.join(sorted(equality) + [f'{column} (range/order)'])
+
+
+class BookFilterBackend(BaseFilterBackend):
+    """Applies BOOK_FILTERS on list requests, refusing unindexed combinations."""
+
+    def filter_queryset(self, request, queryset, view):
+        if getattr(view, 'action', None) != 'list':
+            return queryset
+
+        filters = {}
+        for param, (field_name, lookup) in BOOK_FILTERS.items():
+            raw_value = request.query_params.get(param)
+            if raw_value is None or raw_value == '':
+                continue
+            field = queryset.model._meta.get_field(field_name)
+            try:
+                value = field.to_python(raw_value)
+            except DjangoValidationError as e:
+                raise ValidationError({param: e.messages})
+            filters[f'{field_name}__{lookup}' if lookup != 'exact' else field_name] = value
+
+        searching = bool(request.query_params.get('search'))
+        if searching:
+            if 'ordering' in request.query_params:
+                raise ValidationError({'ordering': 'Search results are ordered by relevance.'})
+            # The full-text index narrows the rows; filters apply on top of it
+            return queryset.filter(**filters)
+
+        ordering = get_book_ordering(request)
+        order_column = ordering[0].lstrip('-')
+        filtered = {key.split('__')[0] for key in filters}
+        equality = frozenset(filtered & EQUALITY_FIELDS)
+        range_columns = filtered - EQUALITY_FIELDS
+
+        # A btree walks the column right after its equality prefix in order,
+        # so ranges are only cheap on the column we are ordering by
+        if range_columns - {order_column} or (equality, order_column) not in INDEXED_COMBINATIONS:
+            raise ValidationError({'detail': (
+                'This combination of filters and ordering is not supported. Supported: '
+                + '; '.join(sorted(_describe(c) for c in INDEXED_COMBINATIONS))
+            )})
+
+        # Keyset paging needs non-null keys; also matches the partial indexes
+        filters.update(non_null_ordering_filters(queryset.model, ordering))
+        return queryset.filter(**filters)
@@ -0,0 +1,317 @@
+"""
+Streaming stages used by the seed commands.
+
+Nothing in here touches the database, so stages can run in background
+threads (see ``prefetch``) while the command writes to Postgres.
+"""
+import io
+import json
+import multiprocessing
+import os
+import queue
+import re
+import threading
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import pandas as pd
+from bs4 import BeautifulSoup
+
+
+def clean_text(text):
+    if pd.isna(text):
+        return text
+
+    # Remove HTML tags
+    text = BeautifulSoup(text, "lxml").text
+
+    # Remove special characters and extra whitespace
+    text = re.sub(r'[^\w\s]', '', text)  # Remove special characters
+    text = re.sub(r'\s+', ' ', text)     # Replace multiple spaces with a single space
+
+    return text.strip()
+
+
+def parse_date(date_str):
+    if date_str:
+        try:
+            # Check if date_str is in YYYY-MM format
+            if re.match(r'^\d{4}-\d{2}$', date_str):
+                # Append '-01' to make it YYYY-MM-DD
+                date_str += '-01'
+            return datetime.strptime(date_str, '%Y-%m-%d').date()
+        except ValueError:
+            return None
+    return None
+
+
+def parse_rating_dist(rating_dist_str):
+    # Use a regular expression to extract the rating distribution values
+    pattern = r'(\d+):(\d+)'
+    rating_dist = {k: int(v) for k, v in re.findall(pattern, rating_dist_str)}
+
+    # Extract the total
+    total_match = re.search(r'total:(\d+)', rating_dist_str)
+    if total_match:
+        rating_dist['total'] = int(total_match.group(1))
+
+    return rating_dist
+
+
+# A run of raw JSONL lines. start_line/end_line are 0-based and end-exclusive,
+# end_offset is the byte offset just past the last line in the chunk.
+LineChunk = namedtuple('LineChunk', ['start_line', 'end_line', 'end_offset', 'lines'])
+ParsedChunk = namedtuple('ParsedChunk', ['start_line', 'end_line', 'end_offset', 'records'])
+
+
+def read_line_chunks(stream, chunk_size, start_line=0, start_offset=0):
+    """
+    Split a JSONL byte stream into chunks of ``chunk_size`` raw lines.
+
+    Resuming from ``start_offset`` seeks the stream (which for a zip member
+    still inflates, but doesn't split lines); ``start_line`` lines are then
+    skipped without being decoded or parsed.
+    """
+    line_number = start_line
+    offset = start_offset
+    if start_offset:
+        stream.seek(start_offset)
+        skip = 0
+    else:
+        skip = start_line
+        line_number = 0
+
+    lines = []
+    first_line = None
+    for raw_line in stream:
+        offset += len(raw_line)
+        line_number += 1
+        if skip:
+            skip -= 1
+            continue
+        if first_line is None:
+            first_line = line_number - 1
+        lines.append(raw_line)
+        if len(lines) >= chunk_size:
+            yield LineChunk(first_line, line_number, offset, lines)
+            lines = []
+            first_line = None
+    if lines:
+        yield LineChunk(first_line, line_number, offset, lines)
+
+
+def parse_book_lines(chunk):
+    # Blank lines would make read_json choke and carry no records anyway
+    payload = b''.join(line for line in chunk.lines if line.strip())
+    if not payload:
+        return ParsedChunk(chunk.start_line, chunk.end_line, chunk.end_offset, [])
+    frame = pd.read_json(io.BytesIO(payload), lines=True)
+    return ParsedChunk(chunk.start_line, chunk.end_line, chunk.end_offset, prepare_book_chunk(frame))
+
+
+class Checkpoint:
+    """
+    Position of the last committed chunk of an import, stored as JSON.
+
+    Written atomically (temp file + rename) so a crash mid-write leaves the
+    previous checkpoint intact.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, **state):
+        state['updated_at'] = datetime.now(timezone.utc).isoformat()
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+
+def prepare_book_chunk(chunk):
+    # Normalise a raw pandas chunk from books.json into plain records
+    chunk['authors'] = chunk['authors'].fillna(0)
+    chunk['num_pages'] = chunk['num_pages'].replace('', 0)
+    chunk['description'] = chunk['description'].apply(clean_text)
+    return chunk.to_dict(orient='records')
+
+
+def book_row(record):
+    """
+    Map one books.json record to plain field values.
+
+    Returns ``(book_fields, distribution_fields, author_ids)``; the
+    distribution is ``None`` when the record has no usable rating_dist.
+    """
+    book_fields = {
+        'title': record.get('title', ''),
+        'work_id': record.get('work_id', ''),
+        'isbn': record.get('isbn', ''),
+        'isbn13': record.get('isbn13', ''),
+        'asin': record.get('asin', ''),
+        'language': record.get('language', ''),
+        'average_rating': record.get('average_rating', 0.00),
+        'ratings_count': record.get('ratings_count', 0),
+        'text_reviews_count': record.get('text_reviews_count', 0),
+        'publication_date': parse_date(record.get('publication_date', None)),
+        'original_publication_date': parse_date(record.get('original_publication_date', None)),
+        'format': record.get('format', ''),
+        'edition_information': record.get('edition_information', ''),
+        'image_url': record.get('image_url', ''),
+        'publisher': record.get('publisher', ''),
+        'num_pages': record.get('num_pages', 0),
+        'description': record.get('description', ''),
+    }
+
+    distribution_fields = None
+    rating_dist = parse_rating_dist(record.get('rating_dist', '') or '')
+    if rating_dist:
+        distribution_fields = {
+            'rating_5': rating_dist.get('5', 0),
+            'rating_4': rating_dist.get('4', 0),
+            'rating_3': rating_dist.get('3', 0),
+            'rating_2': rating_dist.get('2', 0),
+            'rating_1': rating_dist.get('1', 0),
+            'total': rating_dist.get('total', 0),
+        }
+
+    author_ids = [int(author['id']) for author in (record.get('authors') or [])]
+    return book_fields, distribution_fields, author_ids
+
+
+def embed_records(chunks, vectorizer, batch_size=64):
+    """
+    Encode title + description for whole chunks at a time.
+
+    ``chunks`` yields objects with a ``records`` list (e.g. ParsedChunk).
+    Yields ``(chunk, vectors)`` where ``vectors[i]`` belongs to ``chunk.records[i]``.
+    """
+    for chunk in chunks:
+        vectors = vectorizer.generate_vectors(
+            [record.get('title', '') for record in chunk.records],
+            [record.get('description', '') for record in chunk.records],
+            batch_size=batch_size,
+        )
+        yield chunk, vectors
+
+
+# Per-process state for embed_in_processes workers
+_worker_vectorizer = None
+
+
+def _init_embedding_worker(model_name, dimensions, torch_threads):
+    global _worker_vectorizer
+    # Each worker gets its own core(s); letting every process spin up a full
+    # set of torch threads oversubscribes the box
+    import torch
+    torch.set_num_threads(torch_threads)
+
+    from .utils import BookVectorizer
+    _worker_vectorizer = BookVectorizer(model_name, dimensions)
+    _worker_vectorizer.model  # Load once up front rather than on the first chunk
+
+
+def _parse_and_embed(chunk, batch_size):
+    parsed = parse_book_lines(chunk)
+    vectors = _worker_vectorizer.generate_vectors(
+        [record.get('title', '') for record in parsed.records],
+        [record.get('description', '') for record in parsed.records],
+        batch_size=batch_size,
+    )
+    return parsed, vectors
+
+
+def embed_in_processes(line_chunks, workers, model_name, dimensions, batch_size=64, torch_threads=1,
+                       max_pending=None):
+    """
+    Parse, clean and embed LineChunks in a pool of ``workers`` processes.
+
+    Yields ``(ParsedChunk, vectors)`` in input order, so the single writer in
+    the calling process can checkpoint monotonically. At most ``max_pending``
+    chunks (default ``2 * workers``) are in flight, which keeps the reader
+    from racing ahead of the writer.
+    """
+    max_pending = max_pending or workers * 2
+    # spawn rather than fork: forking a process that has torch or a DB
+    # connection loaded is asking for trouble
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=context,
+        initializer=_init_embedding_worker,
+        initargs=(model_name, dimensions, torch_threads),
+    ) as pool:
+        pending = deque()
+        try:
+            for chunk in line_chunks:
+                pending.append(pool.submit(_parse_and_embed, chunk, batch_size))
+                if len(pending) >= max_pending:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+class _StageError:
+    def __init__(self, exc):
+        self.exc = exc
+
+
+_DONE = object()
+
+
+def prefetch(iterable, depth=2):
+    """
+    Run ``iterable`` in a background thread, buffering up to ``depth`` items.
+
+    Chaining a few of these lets parsing, encoding and the DB writes in the
+    consuming thread overlap. The bounded queue provides backpressure so a
+    slow writer doesn't let parsed chunks pile up in memory.
+    """
+    items = queue.Queue(maxsize=depth)
+    stopped = threading.Event()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+        except BaseException as exc:
+            put(_StageError(exc))
+            return
+        put(_DONE)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                break
+            if isinstance(item, _StageError):
+                raise item.exc
+            yield item
+    finally:
+        # Unblock the producer if the consumer stopped early
+        stopped.set()
@@ -0,0 +1,339 @@
+"""
+Bulk database writers used by the seed commands.
+
+Each call writes one chunk in a single transaction. If the bulk insert
+fails, the chunk is retried row by row inside savepoints so that one bad
+record only costs itself and is reported back to the caller.
+
+The ``copy_*`` variants stream the chunk into temporary staging tables with
+``COPY ... FROM STDIN`` and move it into the real tables with ``INSERT ...
+SELECT``. A chunk that COPY rejects falls back to the ORM loader to find
+the offending rows.
+
+Authors keep their source ids, so reloading them skips the ones already
+there (``ON CONFLICT (id) DO NOTHING``). Books get fresh ids and the source
+data has no unique natural key (editions share work_id, many books have no
+ISBN), so loading the same book records twice, with either loader,
+inserts them twice.
+
+Every loader takes ``using``, the database alias to write through (the seed
+commands' ``--database``), so ingestion can run on its own connections.
+"""
+import io
+from functools import partial
+
+from django.core.exceptions import ValidationError
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, transaction
+from django.utils import timezone
+
+from .ingestion import book_row
+from .models import Author, Book, RatingDistribution
+from .signals import books_bulk_saved
+from .utils import content_hash, vectorizer
+
+# What one bad record can raise: the database rejecting it, or a field or
+# the driver failing to convert a malformed value (dates, decimals, ...)
+ROW_ERRORS = (DatabaseError, ValueError, TypeError, ValidationError)
+
+
+def _record_label(record):
+    return record.get('title') or record.get('name') or 'Unknown'
+
+
+def _insert_with_fallback(rows, insert, using=DEFAULT_DB_ALIAS):
+    """
+    Insert ``rows`` (``(label, payload)`` pairs) with ``insert`` in one transaction.
+
+    Returns ``(inserted_count, errors)`` where errors are ``(label, message)``.
+    """
+    if not rows:
+        return 0, []
+
+    try:
+        with transaction.atomic(using=using):
+            insert([payload for _, payload in rows])
+        return len(rows), []
+    except ROW_ERRORS:
+        pass
+
+    # Something in the chunk was rejected; find out which rows by
+    # retrying each in its own savepoint, still committing once per chunk
+    inserted_count = 0
+    errors = []
+    with transaction.atomic(using=using):
+        for label, payload in rows:
+            try:
+                with transaction.atomic(using=using):
+                    insert([payload])
+                inserted_count += 1
+            except ROW_ERRORS as e:
+                errors.append((label, str(e)))
+    return inserted_count, errors
+
+
+def load_authors(records, using=DEFAULT_DB_ALIAS):
+    """Bulk insert author records, skipping ids that already exist."""
+    existing_ids = set(
+        Author.objects.using(using).filter(id__in=[record['id'] for record in records if 'id' in record])
+        .values_list('id', flat=True)
+    )
+
+    rows = []
+    for record in records:
+        if 'id' in record and record['id'] in existing_ids:
+            continue  # Skip existing records
+
+        rows.append((_record_label(record), {
+            'id': record.get('id', None),
+            'name': record.get('name', ''),
+            'gender': record.get('gender', ''),
+            'image_url': record.get('image_url', ''),
+            'about': record.get('about', ''),
+            'ratings_count': record.get('ratings_count', 0),
+            'average_rating': record.get('average_rating', 0.00),
+            'text_reviews_count': record.get('text_reviews_count', 0),
+            'fans_count': record.get('fans_count', 0),
+            'works_count': record.get('works_count', 0),
+        }))
+
+    def insert(payloads):
+        Author.objects.using(using).bulk_create([Author(**fields) for fields in payloads])
+
+    return _insert_with_fallback(rows, insert, using)
+
+
+def _insert_books(payloads, using=DEFAULT_DB_ALIAS):
+    # Instances are built here rather than up front so that a retry after a
+    # rolled back attempt never reuses primary keys assigned by that attempt
+    distributions = []
+    books = []
+    for book_fields, distribution_fields, _ in payloads:
+        distribution = None
+        if distribution_fields is not None:
+            distribution = RatingDistribution(**distribution_fields)
+            distributions.append(distribution)
+        books.append((Book(**book_fields), distribution))
+
+    RatingDistribution.objects.using(using).bulk_create(distributions)
+    for book, distribution in books:
+        book.rating_distribution = distribution
+    Book.objects.using(using).bulk_create([book for book, _ in books])
+
+    BookAuthor = Book.authors.through
+    links = [
+        BookAuthor(book_id=book.id, author_id=author_id)
+        for (book, _), (_, _, author_ids) in zip(books, payloads)
+        for author_id in author_ids
+    ]
+    BookAuthor.objects.using(using).bulk_create(links, ignore_conflicts=True)
+    books_bulk_saved.send(sender=Book, book_ids=[book.id for book, _ in books], using=using)
+
+
+def load_books(records, vectors, using=DEFAULT_DB_ALIAS):
+    """
+    Bulk insert book records together with their rating distributions and
+    author links. ``vectors[i]`` is the embedding for ``records[i]``.
+    """
+    rows = []
+    errors = []
+    for record, vector in zip(records, vectors):
+        try:
+            book_fields, distribution_fields, author_ids = book_row(record)
+        except Exception as e:
+            errors.append((_record_label(record), str(e)))
+            continue
+        book_fields['vector'] = vector
+        book_fields['content_hash'] = content_hash(book_fields['title'], book_fields['description'])
+        book_fields['vector_model'] = vectorizer.model_name
+        rows.append((_record_label(record), (book_fields, distribution_fields, author_ids)))
+
+    # Resolve every author referenced by the chunk in one query; links to
+    # authors we don't know about are dropped, as before
+    referenced_ids = {author_id for _, (_, _, author_ids) in rows for author_id in author_ids}
+    known_ids = set(Author.objects.using(using).filter(id__in=referenced_ids).values_list('id', flat=True))
+    for _, (_, _, author_ids) in rows:
+        author_ids[:] = [author_id for author_id in dict.fromkeys(author_ids) if author_id in known_ids]
+
+    inserted_count, insert_errors = _insert_with_fallback(rows, partial(_insert_books, using=using), using)
+    return inserted_count, errors + insert_errors
+
+
+def _copy_text(value):
+    # Text-format COPY: NULL is \N and backslash, tab and newlines must be escaped
+    if value is None:
+        return '\\N'
+    return (
+        str(value)
+        .replace('\\', '\\\\')
+        .replace('\t', '\\t')
+        .replace('\n', '\\n')
+        .replace('\r', '\\r')
+    )
+
+
+def _copy_rows(cursor, table, columns, rows):
+    qn = cursor.db.ops.quote_name
+    sql = f"COPY {qn(table)} ({', '.join(qn(column) for column in columns)}) FROM STDIN"
+    raw_cursor = cursor.cursor
+    if hasattr(raw_cursor, 'copy'):
+        # psycopg 3 streams rows as we produce them
+        with raw_cursor.copy(sql) as copy:
+            for row in rows:
+                copy.write_row(row)
+    else:
+        # psycopg2 only takes a file-like object
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write('\t'.join(_copy_text(value) for value in row))
+            buffer.write('\n')
+        buffer.seek(0)
+        raw_cursor.copy_expert(sql, buffer)
+
+
+def _copy_via_staging(cursor, model, rows, conflict_columns=None):
+    """
+    COPY ``rows`` (dicts keyed by field attname) into a temporary copy of
+    ``model``'s table and insert them from there, skipping conflicts on
+    ``conflict_columns`` if given.
+
+    Values go through each field's get_db_prep_save, so they are stored
+    exactly as the ORM would store them (including the pgvector text form
+    of Book.vector). Returns the number of rows actually inserted.
+    """
+    qn = cursor.db.ops.quote_name
+    table = model._meta.db_table
+    staging = f'staging_{table}'
+    fields = model._meta.concrete_fields
+    columns = [field.column for field in fields]
+    column_list = ', '.join(qn(column) for column in columns)
+
+    cursor.execute(
+        f'CREATE TEMPORARY TABLE {qn(staging)} (LIKE {qn(table)} INCLUDING DEFAULTS) ON COMMIT DROP'
+    )
+    _copy_rows(cursor, staging, columns, (
+        [field.get_db_prep_save(row.get(field.attname, field.get_default()), cursor.db) for field in fields]
+        for row in rows
+    ))
+    sql = f'INSERT INTO {qn(table)} ({column_list}) SELECT {column_list} FROM {qn(staging)}'
+    if conflict_columns:
+        sql += f" ON CONFLICT ({', '.join(qn(column) for column in conflict_columns)}) DO NOTHING"
+    cursor.execute(sql)
+    return cursor.rowcount
+
+
+def _allocate_ids(cursor, model, count):
+    # Reserve primary keys up front so books, distributions and author links
+    # can reference each other before anything is inserted
+    if not count:
+        return []
+    cursor.execute(
+        'SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)',
+        [model._meta.db_table, model._meta.pk.column, count],
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def _sync_sequence(cursor, model):
+    # Rows inserted with explicit ids don't advance the serial sequence
+    qn = cursor.db.ops.quote_name
+    table = model._meta.db_table
+    pk = model._meta.pk.column
+    cursor.execute(
+        f'SELECT setval(pg_get_serial_sequence(%s, %s), GREATEST((SELECT MAX({qn(pk)}) FROM {qn(table)}), 1))',
+        [table, pk],
+    )
+
+
+def copy_authors(records, using=DEFAULT_DB_ALIAS):
+    """COPY variant of load_authors. Existing author ids are skipped."""
+    rows = [
+        {
+            'id': record.get('id', None),
+            'name': record.get('name', ''),
+            'gender': record.get('gender', ''),
+            'image_url': record.get('image_url', ''),
+            'about': record.get('about', ''),
+            'ratings_count': record.get('ratings_count', 0),
+            'average_rating': record.get('average_rating', 0.00),
+            'text_reviews_count': record.get('text_reviews_count', 0),
+            'fans_count': record.get('fans_count', 0),
+            'works_count': record.get('works_count', 0),
+        }
+        for record in records
+        if record.get('id', None) is not None
+    ]
+    if not rows:
+        return 0, []
+
+    try:
+        with transaction.atomic(using=using), connections[using].cursor() as cursor:
+            inserted_count = _copy_via_staging(cursor, Author, rows, ['id'])
+            _sync_sequence(cursor, Author)
+        return inserted_count, []
+    except ROW_ERRORS:
+        return load_authors(records, using)
+
+
+def copy_books(records, vectors, using=DEFAULT_DB_ALIAS):
+    """COPY variant of load_books. Not idempotent: see the module docstring."""
+    errors = []
+    parsed = []
+    for record, vector in zip(records, vectors):
+        try:
+            book_fields, distribution_fields, author_ids = book_row(record)
+        except Exception as e:
+            errors.append((_record_label(record), str(e)))
+            continue
+        book_fields['vector'] = vector
+        book_fields['content_hash'] = content_hash(book_fields['title'], book_fields['description'])
+        book_fields['vector_model'] = vectorizer.model_name
+        parsed.append((book_fields, distribution_fields, author_ids))
+    if not parsed:
+        return 0, errors
+
+    BookAuthor = Book.authors.through
+    try:
+        with transaction.atomic(using=using), connections[using].cursor() as cursor:
+            book_ids = _allocate_ids(cursor, Book, len(parsed))
+            distribution_ids = iter(_allocate_ids(
+                cursor, RatingDistribution, sum(1 for _, fields, _ in parsed if fields is not None)
+            ))
+
+            book_rows = []
+            distribution_rows = []
+            link_rows = []
+            now = timezone.now()
+            for book_id, (book_fields, distribution_fields, author_ids) in zip(book_ids, parsed):
+                # COPY bypasses auto_now
+                book_rows.append(dict(book_fields, id=book_id, updated_at=now))
+                if distribution_fields is not None:
+                    distribution_id = next(distribution_ids)
+                    distribution_rows.append(dict(distribution_fields, id=distribution_id))
+                    book_rows[-1]['rating_distribution_id'] = distribution_id
+                for author_id in dict.fromkeys(author_ids):
+                    link_rows.append({'book_id': book_id, 'author_id': author_id})
+
+            # Ids were just taken from the sequences, so there is nothing to conflict with
+            _copy_via_staging(cursor, RatingDistribution, distribution_rows)
+            inserted_count = _copy_via_staging(cursor, Book, book_rows)
+
+            # Links are staged separately so that authors we don't know about
+            # can be dropped with a join instead of failing the foreign key
+            qn = cursor.db.ops.quote_name
+            cursor.execute(
+                'CREATE TEMPORARY TABLE staging_book_authors (book_id integer, author_id integer) ON COMMIT DROP'
+            )
+            _copy_rows(cursor, 'staging_book_authors', ['book_id', 'author_id'], (
+                [row['book_id'], row['author_id']] for row in link_rows
+            ))
+            cursor.execute(
+                f'INSERT INTO {qn(BookAuthor._meta.db_table)} (book_id, author_id) '
+                f'SELECT s.book_id, s.author_id FROM staging_book_authors s '
+                f'JOIN {qn(Author._meta.db_table)} a ON a.id = s.author_id '
+                f'ON CONFLICT (book_id, author_id) DO NOTHING'
+            )
+            books_bulk_saved.send(sender=Book, book_ids=book_ids, using=using)
+        return inserted_count, errors
+    except ROW_ERRORS:
+        inserted_count, insert_errors = load_books(records, vectors, using)
+        return inserted_count, insert_errors
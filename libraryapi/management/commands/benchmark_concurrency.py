@@ -0,0 +1,59 @@
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(',') if v]
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test running servers at increasing concurrency, e.g. the WSGI view on one port '
+        'and the ASGI one on another: --url http://127.0.0.1:8000/api/books/ '
+        '--url http://127.0.0.1:8001/api/async/books/'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', action='append', required=True, help='URL to request; repeat to compare servers')
+        parser.add_argument('--concurrency', type=_int_list, default=[1, 8, 32, 128], help='Comma separated client counts')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per URL and concurrency level')
+        parser.add_argument('--token', default=None, help='JWT access token for authenticated endpoints')
+        parser.add_argument('--timeout', type=float, default=30.0)
+
+    def handle(self, *args, **options):
+        headers = {'Authorization': f"Bearer {options['token']}"} if options['token'] else {}
+
+        def fetch(url):
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=options['timeout']) as response:
+                    response.read()
+                    ok = response.status == 200
+            except (urllib.error.URLError, OSError):
+                ok = False
+            return ok, (time.perf_counter() - started) * 1000
+
+        for url in options['url']:
+            self.stdout.write(url)
+            for concurrency in options['concurrency']:
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                    results = list(executor.map(fetch, [url] * options['requests']))
+                elapsed = time.perf_counter() - started
+
+                timings = [ms for ok, ms in results if ok]
+                errors = len(results) - len(timings)
+                # Only successful responses count towards throughput
+                line = f'  concurrency={concurrency:<4} {len(timings) / elapsed:8.1f} req/s'
+                if timings:
+                    line += ''.join(
+                        f' p{q}={np.percentile(timings, q):8.1f}ms' for q in (50, 95, 99)
+                    )
+                if errors:
+                    line += f' errors={errors}'
+                self.stdout.write(line)
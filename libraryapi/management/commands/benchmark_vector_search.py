@@ -0,0 +1,175 @@
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from pgvector.django import L2Distance
+from libraryapi.models import Book
+from libraryapi.similarity import QUANTIZATIONS, VECTOR_INDEX_NAME, ann_search, nearest, vector_index_sql
+
+BENCHMARK_INDEX_NAME = 'libraryapi_book_vector_bench_idx'
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(',') if v]
+
+
+def _quantization_list(value):
+    names = [v for v in value.split(',') if v]
+    unknown = set(names) - set(QUANTIZATIONS)
+    if unknown:
+        raise ValueError(f"unknown quantization {', '.join(sorted(unknown))}")
+    return names
+
+
+def _megabytes(size):
+    return f'{size / 1024 / 1024:.1f}MB'
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare memory footprint, recall@k and latency of ANN indexes on Book.vector against exact search. '
+        'Each --quantization variant is built in a transaction that is rolled back afterwards '
+        '(writes to the book table wait while it runs); --existing measures the current index instead.'
+    )
+
+    def add_arguments(self, parser):
+        index_settings = getattr(settings, 'VECTOR_INDEX', {})
+        parser.add_argument('--queries', type=int, default=100, help='Number of random books used as queries')
+        parser.add_argument('--k', type=int, default=5)
+        parser.add_argument('--ef-search', type=_int_list, default=[20, 40, 100, 200], help='Comma separated HNSW ef_search values')
+        parser.add_argument('--probes', type=_int_list, default=[1, 10, 40], help='Comma separated IVFFlat probes values')
+        parser.add_argument(
+            '--quantization', type=_quantization_list, default=list(QUANTIZATIONS),
+            help=f"Comma separated index variants to build ({', '.join(QUANTIZATIONS)})",
+        )
+        parser.add_argument(
+            '--rerank', type=_int_list, default=[index_settings.get('RERANK_CANDIDATES', 100)],
+            help='Comma separated re-rank pool sizes for quantized variants',
+        )
+        parser.add_argument('--method', choices=['hnsw', 'ivfflat'], default=index_settings.get('METHOD', 'hnsw'))
+        parser.add_argument('--existing', action='store_true', help='Benchmark the index that is already built')
+
+    def handle(self, *args, **options):
+        k = options['k']
+        index_settings = getattr(settings, 'VECTOR_INDEX', {})
+        query_vectors = list(
+            Book.objects.filter(vector__isnull=False).order_by('?').values_list('vector', flat=True)[:options['queries']]
+        )
+        if not query_vectors:
+            self.stdout.write(self.style.WARNING('No books with vectors to benchmark.'))
+            return
+
+        count, vector_bytes = self.vector_storage()
+        self.stdout.write(f'table vectors: {count} rows, {_megabytes(vector_bytes)} ({vector_bytes / max(count, 1):.0f} bytes/row)')
+
+        exact_ids, exact_times = self.run(query_vectors, k, exact=True)
+        self.report('exact (seq scan)', exact_times)
+
+        if options['existing']:
+            index_method = self.index_method()
+            if index_method is None:
+                self.stdout.write(self.style.WARNING('No ANN index on libraryapi_book.vector; run migrate or build_vector_index.'))
+                return
+            quantization = index_settings.get('QUANTIZATION', 'none')
+            self.stdout.write(f'{index_method} ({quantization}) index: {_megabytes(self.index_size(VECTOR_INDEX_NAME))}')
+            self.benchmark(query_vectors, exact_ids, k, index_method, quantization, options)
+            return
+
+        for quantization in options['quantization']:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    started = time.perf_counter()
+                    cursor.execute(vector_index_sql(
+                        method=options['method'],
+                        m=index_settings.get('HNSW_M', 16),
+                        ef_construction=index_settings.get('HNSW_EF_CONSTRUCTION', 64),
+                        lists=index_settings.get('IVFFLAT_LISTS', 1000),
+                        quantization=quantization,
+                        name=BENCHMARK_INDEX_NAME,
+                    ))
+                    build_seconds = time.perf_counter() - started
+                size = self.index_size(BENCHMARK_INDEX_NAME)
+                self.stdout.write(
+                    f"{options['method']} ({quantization}) index: {_megabytes(size)} "
+                    f'({size / max(count, 1):.0f} bytes/row), built in {build_seconds:.1f}s'
+                )
+                self.benchmark(query_vectors, exact_ids, k, options['method'], quantization, options)
+                # Leave the schema as it was
+                transaction.set_rollback(True)
+
+    def benchmark(self, query_vectors, exact_ids, k, index_method, quantization, options):
+        if index_method == 'hnsw':
+            knobs = [('ef_search', {'ef_search': value}) for value in options['ef_search']]
+        else:
+            knobs = [('probes', {'probes': value}) for value in options['probes']]
+        rerank_sizes = options['rerank'] if quantization != 'none' else [None]
+
+        for rerank in rerank_sizes:
+            for name, knob in knobs:
+                ann_ids, ann_times = self.run(
+                    query_vectors, k, quantization=quantization, rerank_candidates=rerank, **knob
+                )
+                recall = np.mean([
+                    len(set(found) & set(expected)) / len(expected)
+                    for found, expected in zip(ann_ids, exact_ids) if expected
+                ])
+                label = f'  {name}={list(knob.values())[0]}'
+                if rerank is not None:
+                    label += f' rerank={rerank}'
+                self.report(label, ann_times, recall)
+
+    def run(self, query_vectors, k, exact=False, **knobs):
+        results = []
+        timings = []
+        for vector in query_vectors:
+            if exact:
+                queryset = Book.objects.filter(vector__isnull=False).annotate(
+                    distance=L2Distance('vector', vector)
+                ).order_by('distance').values_list('id', flat=True)[:k]
+                with ann_search(), connection.cursor() as cursor:
+                    cursor.execute("SELECT set_config('enable_indexscan', 'off', true)")
+                    started = time.perf_counter()
+                    ids = list(queryset)
+                    timings.append((time.perf_counter() - started) * 1000)
+            else:
+                started = time.perf_counter()
+                ids = [row['id'] for row in nearest(Book.objects.all(), vector, ('id',), limit=k, **knobs)]
+                timings.append((time.perf_counter() - started) * 1000)
+            results.append(ids)
+        return results, timings
+
+    def report(self, label, timings, recall=None):
+        line = f'{label:<28} p50={np.percentile(timings, 50):8.2f}ms p95={np.percentile(timings, 95):8.2f}ms'
+        if recall is not None:
+            line += f' recall@k={recall:.3f}'
+        self.stdout.write(line)
+
+    def vector_storage(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT count(*), coalesce(sum(pg_column_size(vector)), 0) FROM {Book._meta.db_table} '
+                'WHERE vector IS NOT NULL'
+            )
+            return cursor.fetchone()
+
+    def index_size(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_relation_size(to_regclass(%s))', [name])
+            size = cursor.fetchone()[0]
+        if size is None:
+            raise CommandError(f'Index {name} does not exist')
+        return size
+
+    def index_method(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT am.amname FROM pg_index i '
+                'JOIN pg_class c ON c.oid = i.indexrelid '
+                'JOIN pg_am am ON am.oid = c.relam '
+                'WHERE i.indrelid = %s::regclass AND am.amname IN (%s, %s)',
+                [Book._meta.db_table, 'hnsw', 'ivfflat'],
+            )
+            row = cursor.fetchone()
+        return row[0] if row else None
@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from libraryapi.similarity import QUANTIZATIONS, VECTOR_INDEX_NAME, vector_index_sql
+
+
+class Command(BaseCommand):
+    help = 'Drop and rebuild the approximate nearest-neighbour index on Book.vector'
+
+    def add_arguments(self, parser):
+        index_settings = getattr(settings, 'VECTOR_INDEX', {})
+        parser.add_argument('--method', choices=['hnsw', 'ivfflat'], default=index_settings.get('METHOD', 'hnsw'))
+        parser.add_argument('--m', type=int, default=index_settings.get('HNSW_M', 16), help='HNSW: links per node')
+        parser.add_argument(
+            '--ef-construction', type=int, default=index_settings.get('HNSW_EF_CONSTRUCTION', 64),
+            help='HNSW: candidate list size while building',
+        )
+        parser.add_argument(
+            '--lists', type=int, default=index_settings.get('IVFFLAT_LISTS', 1000),
+            help='IVFFlat: number of clusters (rows / 1000 is a good start, sqrt(rows) above 1M)',
+        )
+        parser.add_argument(
+            '--quantization', choices=list(QUANTIZATIONS), default=index_settings.get('QUANTIZATION', 'none'),
+            help='Index halfvec or binary-quantized vectors instead of full float32 ones',
+        )
+        parser.add_argument('--maintenance-work-mem', default='1GB', help='Memory for the build; HNSW is much faster when the graph fits')
+        parser.add_argument('--blocking', action='store_true', help='Build without CONCURRENTLY (locks writes, but faster)')
+
+    def handle(self, *args, **options):
+        concurrently = not options['blocking']
+        sql = vector_index_sql(
+            method=options['method'],
+            m=options['m'],
+            ef_construction=options['ef_construction'],
+            lists=options['lists'],
+            concurrently=concurrently,
+            quantization=options['quantization'],
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT set_config(%s, %s, false)', ['maintenance_work_mem', options['maintenance_work_mem']])
+            cursor.execute(f"DROP INDEX {'CONCURRENTLY ' if concurrently else ''}IF EXISTS {VECTOR_INDEX_NAME}")
+            self.stdout.write(sql)
+            cursor.execute(sql)
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {VECTOR_INDEX_NAME} using {options["method"]} ({options["quantization"]}).'))
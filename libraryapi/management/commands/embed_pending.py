@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from libraryapi.embedding_queue import embed_books
+from libraryapi.models import Book
+
+
+class Command(BaseCommand):
+    help = 'Embed books whose vectors are still pending (or failed) from API writes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=256, help='Books encoded per call')
+        parser.add_argument('--retry-failed', action='store_true', help='Also retry books marked failed')
+
+    def handle(self, *args, **options):
+        statuses = [Book.VECTOR_PENDING]
+        if options['retry_failed']:
+            statuses.append(Book.VECTOR_FAILED)
+
+        total = 0
+        last_id = 0
+        while True:
+            # Walks the small partial index on unfinished books, in id order
+            book_ids = list(
+                Book.objects.filter(vector_status__in=statuses, id__gt=last_id)
+                .order_by('id').values_list('id', flat=True)[:options['batch_size']]
+            )
+            if not book_ids:
+                break
+            last_id = book_ids[-1]
+            try:
+                total += embed_books(book_ids)
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f'Batch ending at book {last_id} failed: {e}'))
+
+        self.stdout.write(self.style.SUCCESS(f'Embedded {total} books.'))
@@ -0,0 +1,39 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from libraryapi.export import export_rows, gzip_chunks, ndjson_chunks, parse_updated_since
+
+class Command(BaseCommand):
+    help = 'Stream the book catalogue as NDJSON (optionally gzip-compressed) to a file or stdout'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='-', help="Output file, or '-' for stdout")
+        parser.add_argument('--updated-since', default=None, help='Only books changed at or after this ISO date/datetime')
+        parser.add_argument('--vectors', action='store_true', help='Include vectors as base64 float16')
+        parser.add_argument('--gzip', action='store_true', help='gzip-compress the output')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched from the server-side cursor at a time')
+
+    def handle(self, *args, **options):
+        updated_since = None
+        if options['updated_since']:
+            updated_since = parse_updated_since(options['updated_since'])
+            if updated_since is None:
+                raise CommandError(f"Invalid --updated-since: {options['updated_since']}")
+
+        started_at = timezone.now()
+        chunks = ndjson_chunks(export_rows(
+            updated_since, include_vectors=options['vectors'], chunk_size=options['chunk_size'],
+        ))
+        if options['gzip']:
+            chunks = gzip_chunks(chunks)
+
+        output = sys.stdout.buffer if options['output'] == '-' else open(options['output'], 'wb')
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+
+        # Messages go to stderr so they never end up in a piped export
+        self.stderr.write(f'Export started at {started_at.isoformat()}; use it as --updated-since next time.')
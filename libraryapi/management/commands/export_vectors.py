@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from libraryapi.models import Book
+from libraryapi.similarity import vector_store
+from libraryapi.utils import vectorizer
+from libraryapi.vector_store import VectorStore
+
+class Command(BaseCommand):
+    help = 'Export Book.vector into a new generation of the memory-mapped vector store'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=None, help="Store directory (defaults to settings.VECTOR_STORE['PATH'])")
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched from the database at a time')
+        parser.add_argument('--keep-previous', action='store_true', help='Keep the previous generation on disk')
+
+    def handle(self, *args, **options):
+        store = VectorStore(options['path']) if options['path'] else vector_store()
+        books = Book.objects.filter(vector__isnull=False)
+        count = books.count()
+        rows = books.order_by('id').values_list('id', 'vector').iterator(chunk_size=options['chunk_size'])
+
+        written, previous = store.export(
+            rows, count, Book._meta.get_field('vector').dimensions, model_name=vectorizer.model_name,
+        )
+        if previous is not None and not options['keep_previous']:
+            # Workers switch to the new generation on their next refresh;
+            # open mappings of the old files stay valid until then
+            store.remove_generation(previous)
+
+        self.stdout.write(self.style.SUCCESS(f'Exported {written} vectors to {store.path}.'))
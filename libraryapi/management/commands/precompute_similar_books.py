@@ -0,0 +1,86 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from libraryapi.models import Book, BookNeighbors
+from libraryapi.neighbors import block_neighbors
+
+
+class Command(BaseCommand):
+    help = 'Compute the top-k most similar books for every book and store them in BookNeighbors'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, default=20, help='Neighbours stored per book')
+        parser.add_argument('--block-size', type=int, default=512, help='Query rows per matrix multiplication')
+        parser.add_argument('--tile-size', type=int, default=65536, help='Matrix rows multiplied against a block at a time')
+        parser.add_argument('--workers', type=int, default=4, help='Threads computing blocks (NumPy releases the GIL)')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched from the database at a time')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        ids, matrix = self.load_vectors(options['chunk_size'])
+        if not len(ids):
+            self.stdout.write(self.style.WARNING('No books with vectors.'))
+            return
+        norms = np.einsum('ij,ij->i', matrix, matrix)
+        self.stdout.write(f'Loaded {len(ids)} vectors in {time.monotonic() - started:.1f}s')
+
+        k = min(options['k'], len(ids) - 1)
+        block_size = options['block_size']
+        starts = range(0, len(ids), block_size)
+
+        def compute(start):
+            block_ids = ids[start:start + block_size]
+            return block_ids, block_neighbors(
+                matrix[start:start + block_size], block_ids, matrix, norms, ids, k, options['tile_size'],
+            )
+
+        written = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            # map() yields in order, so the database writes stay on this thread
+            for block_ids, (neighbor_ids, distances) in executor.map(compute, starts):
+                self.save_block(block_ids, neighbor_ids, distances)
+                written += len(block_ids)
+                self.stdout.write(f'{written}/{len(ids)} books ({time.monotonic() - started:.0f}s)')
+
+        # Books that lost their vector since the last run
+        stale = BookNeighbors.objects.exclude(book_id__in=Book.objects.filter(vector__isnull=False).values('id'))
+        stale.delete()
+        self.stdout.write(self.style.SUCCESS(f'Stored {k} neighbours for {written} books.'))
+
+    def load_vectors(self, chunk_size):
+        books = Book.objects.filter(vector__isnull=False)
+        count = books.count()
+        dimensions = Book._meta.get_field('vector').dimensions
+        ids = np.empty(count, dtype=np.int64)
+        matrix = np.empty((count, dimensions), dtype=np.float32)
+        loaded = 0
+        for book_id, vector in books.order_by('id').values_list('id', 'vector').iterator(chunk_size=chunk_size):
+            if loaded == count:
+                break
+            ids[loaded] = book_id
+            matrix[loaded] = vector
+            loaded += 1
+        return ids[:loaded], matrix[:loaded]
+
+    def save_block(self, block_ids, neighbor_ids, distances):
+        # Skip books deleted while the run was going
+        existing = set(Book.objects.filter(id__in=block_ids.tolist()).values_list('id', flat=True))
+        rows = [
+            BookNeighbors(
+                book_id=int(book_id),
+                neighbor_ids=[int(neighbor_id) for neighbor_id in row_ids],
+                distances=[round(float(distance), 6) for distance in row_distances],
+            )
+            for book_id, row_ids, row_distances in zip(block_ids, neighbor_ids, distances)
+            if book_id in existing
+        ]
+        with transaction.atomic():
+            BookNeighbors.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=['book'],
+                update_fields=['neighbor_ids', 'distances', 'computed_at'],
+            )
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from libraryapi.aggregates import refresh_author_range
+from libraryapi.cache import invalidate
+from libraryapi.models import Author
+
+
+class Command(BaseCommand):
+    help = 'Recompute every AuthorAggregate row from the books (e.g. after a bulk load or a manual SQL fix)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000, help='Author ids refreshed per transaction')
+
+    def handle(self, *args, **options):
+        max_id = Author.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+        batch_size = options['batch_size']
+        total = 0
+        for start in range(0, max_id + 1, batch_size):
+            with transaction.atomic():
+                total += refresh_author_range(start, start + batch_size)
+            self.stdout.write(f'{min(start + batch_size, max_id + 1)}/{max_id + 1} author ids')
+
+        invalidate('author')
+        self.stdout.write(self.style.SUCCESS(f'Refreshed aggregates for {total} authors.'))
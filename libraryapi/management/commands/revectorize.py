@@ -0,0 +1,79 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+from libraryapi.embedding_queue import embed_books, stale_vectors_q
+from libraryapi.ingestion import Checkpoint
+from libraryapi.models import Book
+from libraryapi.utils import vectorizer
+
+class Command(BaseCommand):
+    help = (
+        'Re-embed only the books whose vector is missing, was made by another model '
+        'or no longer matches the title/description'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', default=None, help='Embedding model (defaults to settings.EMBEDDING_MODEL_NAME)')
+        parser.add_argument('--batch-size', type=int, default=256, help='Stale books encoded and written per batch')
+        parser.add_argument('--scan-size', type=int, default=10000, help='Id range examined per keyset step')
+        parser.add_argument(
+            '--checkpoint', default='revectorize.checkpoint.json',
+            help='File recording the last id that was fully processed',
+        )
+        parser.add_argument('--resume', action='store_true', help='Continue after the last id in --checkpoint')
+        parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between batches to spare a live database')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the stale books')
+
+    def handle(self, *args, **options):
+        model_name = options['model'] or vectorizer.model_name
+        stale = Book.objects.filter(stale_vectors_q(model_name))
+
+        if options['dry_run']:
+            self.stdout.write(f'{stale.count()} books need embedding with {model_name}.')
+            return
+
+        checkpoint = Checkpoint(options['checkpoint'])
+        last_id = 0
+        total = 0
+        if options['resume']:
+            state = checkpoint.load()
+            if state is None:
+                raise CommandError(f'No checkpoint found at {checkpoint.path}')
+            if state.get('model') != model_name:
+                raise CommandError(f"Checkpoint is for model {state.get('model')}, not {model_name}")
+            last_id = state['last_id']
+            total = state.get('total_embedded', 0)
+            self.stdout.write(f'Resuming after book {last_id} ({total} books already embedded)')
+
+        # Books created after this point are embedded by the API's own queue
+        max_id = Book.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+        started = time.monotonic()
+        while last_id < max_id:
+            # Keyset step over the primary key: the stale test runs on at most
+            # scan_size ids and only the stale ones come back
+            window_end = min(last_id + options['scan_size'], max_id)
+            book_ids = list(
+                stale.filter(id__gt=last_id, id__lte=window_end)
+                .order_by('id').values_list('id', flat=True)[:options['batch_size']]
+            )
+            if len(book_ids) == options['batch_size']:
+                # The window has more stale rows; continue right after this batch
+                window_end = book_ids[-1]
+
+            if book_ids:
+                try:
+                    written = embed_books(book_ids, model_name=model_name)
+                except Exception as e:
+                    raise CommandError(f'Embedding failed after book {last_id}: {e}')
+                total += written
+                if written < len(book_ids):
+                    self.stdout.write(f'{len(book_ids) - written} books changed or locked mid-batch; skipped')
+
+            last_id = window_end
+            checkpoint.save(model=model_name, last_id=last_id, max_id=max_id, total_embedded=total)
+            rate = total / max(time.monotonic() - started, 1e-9)
+            self.stdout.write(f'Up to book {last_id} of {max_id}: {total} embedded ({rate:.0f}/s)')
+            if book_ids and options['pause']:
+                time.sleep(options['pause'])
+
+        self.stdout.write(self.style.SUCCESS(f'Embedded {total} books with {model_name}.'))
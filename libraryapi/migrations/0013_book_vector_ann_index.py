@@ -0,0 +1,47 @@
+# Approximate nearest-neighbour index for Book.vector
+
+from django.conf import settings
+from django.db import migrations
+
+INDEX_NAME = 'libraryapi_book_vector_ann_idx'
+
+
+def create_vector_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    index_settings = getattr(settings, 'VECTOR_INDEX', {})
+    method = index_settings.get('METHOD', 'hnsw')
+    if method == 'hnsw':
+        options = 'WITH (m = %d, ef_construction = %d)' % (
+            int(index_settings.get('HNSW_M', 16)),
+            int(index_settings.get('HNSW_EF_CONSTRUCTION', 64)),
+        )
+    elif method == 'ivfflat':
+        # IVFFlat centroids are trained on the rows present at build time; on
+        # an empty table rebuild it with `manage.py build_vector_index` after seeding
+        options = 'WITH (lists = %d)' % int(index_settings.get('IVFFLAT_LISTS', 1000))
+    else:
+        raise ValueError(f"Unsupported VECTOR_INDEX['METHOD']: {method!r}")
+
+    # L2 operator class to match the L2Distance ordering used by the views
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON libraryapi_book '
+        f'USING {method} (vector vector_l2_ops) {options}'
+    )
+
+
+def drop_vector_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libraryapi', '0012_alter_author_gender'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_vector_index, drop_vector_index),
+    ]
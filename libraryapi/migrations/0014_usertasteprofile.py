@@ -0,0 +1,51 @@
+# Generated by Django 5.1 on 2026-10-18 18:45
+
+import django.db.models.deletion
+import numpy as np
+import pgvector.django.vector
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_taste_profiles(apps, schema_editor):
+    UserFavorite = apps.get_model('libraryapi', 'UserFavorite')
+    UserTasteProfile = apps.get_model('libraryapi', 'UserTasteProfile')
+
+    vectors_by_user = {}
+    counts_by_user = {}
+    for user_id, vector in UserFavorite.objects.values_list('user_id', 'book__vector').iterator():
+        counts_by_user[user_id] = counts_by_user.get(user_id, 0) + 1
+        if vector is not None:
+            vectors_by_user.setdefault(user_id, []).append(vector)
+
+    UserTasteProfile.objects.bulk_create([
+        UserTasteProfile(
+            user_id=user_id,
+            vector=np.mean(vectors_by_user[user_id], axis=0) if user_id in vectors_by_user else None,
+            favorite_count=count,
+            vector_count=len(vectors_by_user.get(user_id, [])),
+        )
+        for user_id, count in counts_by_user.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libraryapi', '0013_book_vector_ann_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserTasteProfile',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='taste_profile', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('vector', pgvector.django.vector.VectorField(blank=True, dimensions=384, null=True)),
+                ('favorite_count', models.IntegerField(default=0)),
+                ('vector_count', models.IntegerField(default=0)),
+                ('updated_on', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(backfill_taste_profiles, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1 on 2026-10-18 18:46
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# Same expression as libraryapi.search.refresh_search_vectors
+BACKFILL_SEARCH_VECTORS = """
+UPDATE libraryapi_book b SET search_vector =
+    setweight(to_tsvector('english', coalesce(b.title, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce((
+        SELECT string_agg(a.name, ' ')
+        FROM libraryapi_author a
+        JOIN libraryapi_book_authors ba ON ba.author_id = a.id
+        WHERE ba.book_id = b.id
+    ), '')), 'B')
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libraryapi', '0014_usertasteprofile'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='book',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        # Fill before building the GIN index rather than updating it row by row
+        migrations.RunSQL(BACKFILL_SEARCH_VECTORS, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='book',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='libraryapi_book_search_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['title'], name='libraryapi_book_title_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
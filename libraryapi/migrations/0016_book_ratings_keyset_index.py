@@ -0,0 +1,17 @@
+# Generated by Django 5.1 on 2026-10-18 18:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libraryapi', '0015_book_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['ratings_count', 'id'], name='libraryapi_book_ratings_id_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.1 on 2026-10-18 18:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libraryapi', '0016_book_ratings_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['average_rating', 'id'], name='libraryapi_book_avg_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('publication_date__isnull', False)), fields=['publication_date', 'id'], name='libraryapi_book_pub_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['language', 'id'], name='libraryapi_book_lang_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['language', 'average_rating', 'id'], name='libraryapi_book_lang_avg_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['language', 'ratings_count', 'id'], name='libraryapi_book_lang_cnt_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('publication_date__isnull', False)), fields=['language', 'publication_date', 'id'], name='libraryapi_book_lang_pub_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['publisher', 'id'], name='libraryapi_book_publ_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('publication_date__isnull', False)), fields=['publisher', 'publication_date', 'id'], name='libraryapi_book_publ_pub_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['format', 'id'], name='libraryapi_book_fmt_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['format', 'ratings_count', 'id'], name='libraryapi_book_fmt_cnt_idx'),
+        ),
+    ]
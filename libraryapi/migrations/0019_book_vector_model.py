@@ -0,0 +1,30 @@
+# Generated by Django 5.1 on 2026-10-18 18:54
+
+from django.db import migrations, models
+
+# Every vector stored before this migration came from all-MiniLM-L6-v2 over
+# "<title> <description>", so stamp them instead of re-embedding the catalogue.
+# The hash expression matches libraryapi.utils.content_hash.
+STAMP_EXISTING_VECTORS = """
+UPDATE libraryapi_book SET
+    vector_model = 'all-MiniLM-L6-v2',
+    content_hash = CASE WHEN content_hash = ''
+        THEN encode(sha256(convert_to(title || ' ' || description, 'UTF8')), 'hex')
+        ELSE content_hash END
+WHERE vector IS NOT NULL AND vector_model = ''
+"""
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libraryapi', '0018_book_vector_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='vector_model',
+            field=models.CharField(blank=True, editable=False, max_length=200),
+        ),
+        migrations.RunSQL(STAMP_EXISTING_VECTORS, migrations.RunSQL.noop),
+    ]
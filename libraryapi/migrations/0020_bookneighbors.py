@@ -0,0 +1,24 @@
+# Generated by Django 5.1 on 2026-10-18 18:58
+
+import django.contrib.postgres.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libraryapi', '0019_book_vector_model'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookNeighbors',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='neighbors', serialize=False, to='libraryapi.book')),
+                ('neighbor_ids', django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), size=None)),
+                ('distances', django.contrib.postgres.fields.ArrayField(base_field=models.FloatField(), size=None)),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
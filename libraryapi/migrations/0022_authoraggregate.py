@@ -0,0 +1,52 @@
+# Generated by Django 5.1 on 2026-10-18 19:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Author pages look books up by author_id. The unique index leads with
+# book_id and the foreign key index only has author_id; (author_id, book_id)
+# lets the lookup be an index-only scan.
+CREATE_AUTHOR_BOOK_INDEX = """
+CREATE INDEX IF NOT EXISTS libraryapi_book_authors_author_book_idx
+ON libraryapi_book_authors (author_id, book_id)
+"""
+DROP_AUTHOR_BOOK_INDEX = 'DROP INDEX IF EXISTS libraryapi_book_authors_author_book_idx'
+
+# Same query as libraryapi.aggregates, for every author
+BACKFILL_AUTHOR_AGGREGATES = """
+INSERT INTO libraryapi_authoraggregate (author_id, book_count, ratings_count, text_reviews_count, average_rating, updated_at)
+SELECT
+    a.id,
+    count(b.id),
+    coalesce(sum(b.ratings_count), 0),
+    coalesce(sum(b.text_reviews_count), 0),
+    coalesce(round(sum(b.average_rating * b.ratings_count) / nullif(sum(b.ratings_count), 0), 2), 0),
+    now()
+FROM libraryapi_author a
+LEFT JOIN libraryapi_book_authors ba ON ba.author_id = a.id
+LEFT JOIN libraryapi_book b ON b.id = ba.book_id
+GROUP BY a.id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libraryapi', '0021_book_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorAggregate',
+            fields=[
+                ('author', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='aggregate', serialize=False, to='libraryapi.author')),
+                ('book_count', models.IntegerField(default=0)),
+                ('ratings_count', models.BigIntegerField(default=0)),
+                ('text_reviews_count', models.BigIntegerField(default=0)),
+                ('average_rating', models.DecimalField(decimal_places=2, default=0.0, max_digits=3)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunSQL(CREATE_AUTHOR_BOOK_INDEX, DROP_AUTHOR_BOOK_INDEX),
+        migrations.RunSQL(BACKFILL_AUTHOR_AGGREGATES, migrations.RunSQL.noop),
+    ]
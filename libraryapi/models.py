@@ -1,5 +1,9 @@
+import numpy as np
 from django.db import models
 from django.contrib.auth.models import User
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from pgvector.django import VectorField
 
 class Author(models.Model):
@@ -23,7 +27,33 @@ class Author(models.Model):
             models.Index(fields=['name']),
         ]
 
+class AuthorAggregate(models.Model):
+    """
+    Stats over the books an author has in the catalogue, maintained by
+    libraryapi.aggregates (Author's own rating fields come from the source
+    data and are never recomputed).
+    """
+    author = models.OneToOneField(Author, on_delete=models.CASCADE, primary_key=True, related_name='aggregate')
+    book_count = models.IntegerField(default=0)
+    ratings_count = models.BigIntegerField(default=0)
+    text_reviews_count = models.BigIntegerField(default=0)
+    # Mean of the books' average_rating weighted by their ratings_count
+    average_rating = models.DecimalField(max_digits=3, decimal_places=2, default=0.00)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'Aggregates for {self.author_id}'
+
 class Book(models.Model):
+    VECTOR_PENDING = 'pending'
+    VECTOR_READY = 'ready'
+    VECTOR_FAILED = 'failed'
+    VECTOR_STATUS_CHOICES = [
+        (VECTOR_PENDING, 'Pending'),
+        (VECTOR_READY, 'Ready'),
+        (VECTOR_FAILED, 'Failed'),
+    ]
+
     id = models.AutoField(primary_key=True)
     title = models.CharField(max_length=255)
     authors = models.ManyToManyField(Author, related_name='books')
@@ -51,12 +81,56 @@ class Book(models.Model):
         blank=True
     )
     vector = VectorField(dimensions=384, null=True, blank=True)
+    # sha256 of the title + description text that `vector` was computed from
+    content_hash = models.CharField(max_length=64, blank=True, editable=False)
+    # Embedding model that produced `vector`; rows from another model are stale
+    vector_model = models.CharField(max_length=200, blank=True, editable=False)
+    # Embedding happens in the background (libraryapi.embedding_queue) after a write
+    vector_status = models.CharField(
+        max_length=10, choices=VECTOR_STATUS_CHOICES, default=VECTOR_READY, editable=False
+    )
+    # Title (weight A) + author names (weight B), maintained by libraryapi.search
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Bumped on every change that shows up in an export (libraryapi.export),
+    # including bulk writes that bypass auto_now
+    updated_at = models.DateTimeField(auto_now=True)
     def __str__(self):
         return self.title
 
     class Meta:
         indexes = [
             models.Index(fields=['title']),
+            # Keyset pagination by popularity; scanned backwards for descending pages
+            models.Index(fields=['ratings_count', 'id'], name='libraryapi_book_ratings_id_idx'),
+            # Filter/order combinations accepted by libraryapi.filters.BookFilterBackend
+            models.Index(fields=['average_rating', 'id'], name='libraryapi_book_avg_id_idx'),
+            models.Index(
+                fields=['publication_date', 'id'], name='libraryapi_book_pub_id_idx',
+                condition=models.Q(publication_date__isnull=False),
+            ),
+            models.Index(fields=['language', 'id'], name='libraryapi_book_lang_id_idx'),
+            models.Index(fields=['language', 'average_rating', 'id'], name='libraryapi_book_lang_avg_idx'),
+            models.Index(fields=['language', 'ratings_count', 'id'], name='libraryapi_book_lang_cnt_idx'),
+            models.Index(
+                fields=['language', 'publication_date', 'id'], name='libraryapi_book_lang_pub_idx',
+                condition=models.Q(publication_date__isnull=False),
+            ),
+            models.Index(fields=['publisher', 'id'], name='libraryapi_book_publ_id_idx'),
+            models.Index(
+                fields=['publisher', 'publication_date', 'id'], name='libraryapi_book_publ_pub_idx',
+                condition=models.Q(publication_date__isnull=False),
+            ),
+            models.Index(fields=['format', 'id'], name='libraryapi_book_fmt_id_idx'),
+            models.Index(fields=['format', 'ratings_count', 'id'], name='libraryapi_book_fmt_cnt_idx'),
+            # Incremental exports: updated_at >= ? in (updated_at, id) order
+            models.Index(fields=['updated_at', 'id'], name='libraryapi_book_updated_idx'),
+            # Small: only books still waiting for (or failed) embedding
+            models.Index(
+                fields=['id'], name='libraryapi_book_vec_todo_idx',
+                condition=~models.Q(vector_status='ready'),
+            ),
+            GinIndex(fields=['search_vector'], name='libraryapi_book_search_gin'),
+            GinIndex(fields=['title'], name='libraryapi_book_title_trgm', opclasses=['gin_trgm_ops']),
         ]
 
 class RatingDistribution(models.Model):    
@@ -80,3 +154,63 @@ class UserFavorite(models.Model):
 
     def __str__(self):
         return f'{self.user.username} - {self.book.title}'
+
+class UserTasteProfile(models.Model):
+    """
+    Running mean of the vectors of a user's favorite books.
+
+    Updated incrementally as favorites are added, so recommendations never
+    have to reload and average every favorite. Removals and re-embedded
+    books rebuild it from the (at most MAX_FAVORITES) remaining favorites.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='taste_profile')
+    vector = VectorField(dimensions=384, null=True, blank=True)
+    favorite_count = models.IntegerField(default=0)
+    # Favorites whose book has a vector; the mean is taken over these only
+    vector_count = models.IntegerField(default=0)
+    updated_on = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'Taste profile for {self.user.username}'
+
+    def add_favorite(self, book_vector):
+        self.favorite_count += 1
+        if book_vector is None:
+            return
+        book_vector = np.asarray(book_vector, dtype=np.float64)
+        if self.vector is None or self.vector_count == 0:
+            self.vector = book_vector
+        else:
+            mean = np.asarray(self.vector, dtype=np.float64)
+            self.vector = mean + (book_vector - mean) / (self.vector_count + 1)
+        self.vector_count += 1
+
+    def remove_favorite(self, remaining_vectors):
+        # Rebuilt from the favorites that are left rather than by subtracting
+        # the removed book's vector, which may have been (re-)embedded since
+        # it was added
+        self.rebuild(remaining_vectors)
+
+    def rebuild(self, book_vectors):
+        """Recompute from the vectors of every current favorite (``None`` for books without one)."""
+        self.favorite_count = len(book_vectors)
+        vectors = [np.asarray(vector, dtype=np.float64) for vector in book_vectors if vector is not None]
+        self.vector_count = len(vectors)
+        self.vector = np.mean(vectors, axis=0) if vectors else None
+
+
+class BookNeighbors(models.Model):
+    """
+    Precomputed nearest books by vector (manage.py precompute_similar_books).
+
+    One row per book keeps "more like this" a primary key lookup. Rows are
+    dropped when the book's vector changes and rebuilt by the next run.
+    """
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, primary_key=True, related_name='neighbors')
+    # Closest first; distances[i] is the L2 distance to neighbor_ids[i]
+    neighbor_ids = ArrayField(models.IntegerField())
+    distances = ArrayField(models.FloatField())
+    computed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'Neighbors of {self.book_id}'
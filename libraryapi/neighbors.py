@@ -0,0 +1,74 @@
+"""
+Precomputed "similar books" lists (BookNeighbors).
+
+precompute_similar_books computes exact top-k neighbours for every book
+with blocked matrix multiplication: a block of query rows is multiplied
+against the whole vector matrix one column tile at a time, keeping a
+running top-k per row, so memory stays at block_size x tile_size floats
+however large the catalogue is. Serving a list is then one primary key
+lookup plus one query for the neighbours' titles.
+"""
+import numpy as np
+
+from .models import Book, BookNeighbors
+
+
+def block_neighbors(block, block_ids, matrix, norms, ids, k, tile_size=65536):
+    """
+    Exact L2 top-``k`` of every row of ``block`` among the rows of ``matrix``.
+
+    Returns ``(neighbor_ids, distances)``, two ``len(block) x k`` arrays
+    sorted closest first. A row is never its own neighbour.
+    """
+    block = np.asarray(block, dtype=np.float32)
+    block_norms = np.einsum('ij,ij->i', block, block)
+    best_scores = np.full((len(block), 0), np.inf, dtype=np.float32)
+    best_ids = np.empty((len(block), 0), dtype=np.int64)
+
+    for start in range(0, len(matrix), tile_size):
+        tile = matrix[start:start + tile_size]
+        tile_ids = ids[start:start + tile_size]
+        # ||x||^2 - 2 q.x (||q||^2 is added back at the end)
+        scores = norms[start:start + tile_size][None, :] - 2 * (block @ tile.T)
+        scores[block_ids[:, None] == tile_ids[None, :]] = np.inf
+
+        # Merge this tile's candidates with the best found so far
+        scores = np.concatenate([best_scores, scores], axis=1)
+        candidate_ids = np.concatenate([best_ids, np.broadcast_to(tile_ids, (len(block), len(tile_ids)))], axis=1)
+        keep = min(k, scores.shape[1])
+        top = np.argpartition(scores, keep - 1, axis=1)[:, :keep]
+        best_scores = np.take_along_axis(scores, top, axis=1)
+        best_ids = np.take_along_axis(candidate_ids, top, axis=1)
+
+    order = np.argsort(best_scores, axis=1, kind='stable')
+    best_scores = np.take_along_axis(best_scores, order, axis=1)
+    best_ids = np.take_along_axis(best_ids, order, axis=1)
+    distances = np.sqrt(np.maximum(best_scores + block_norms[:, None], 0))
+    return best_ids, distances
+
+
+def precomputed_neighbors(book_ids, limit=10, offset=0):
+    """
+    Neighbour lists for ``book_ids`` as ``{book_id: [{'id', 'title', 'similarity'}]}``.
+
+    Books without a precomputed row (or with too short a list for the
+    requested page) are left out so callers can fall back to a live query.
+    """
+    rows = {
+        row.book_id: row for row in BookNeighbors.objects.filter(book_id__in=book_ids)
+        if len(row.neighbor_ids) >= offset + limit
+    }
+    pages = {
+        book_id: list(zip(row.neighbor_ids, row.distances))[offset:offset + limit]
+        for book_id, row in rows.items()
+    }
+    wanted = {neighbor_id for page in pages.values() for neighbor_id, _ in page}
+    titles = dict(Book.objects.filter(id__in=wanted).values_list('id', 'title'))
+    # Neighbours deleted since the last run are skipped
+    return {
+        book_id: [
+            {'id': neighbor_id, 'title': titles[neighbor_id], 'similarity': distance}
+            for neighbor_id, distance in page if neighbor_id in titles
+        ]
+        for book_id, page in pages.items()
+    }
@@ -0,0 +1,231 @@
+"""
+Pagination classes that avoid OFFSET scans and COUNT(*) on large tables.
+
+KeysetPagination pages by the values of the ordering columns of the last
+row served (``WHERE (ratings_count, id) < (...)`` in effect), so every page
+costs the same no matter how deep it is. The cursor is opaque to clients.
+Totals are not computed; ``?count=estimate`` adds a planner estimate instead.
+"""
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.db import connection
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def estimate_count(queryset):
+    """
+    Approximate row count without scanning the table.
+
+    Unfiltered querysets use pg_class.reltuples; anything else uses the
+    planner's row estimate for the query.
+    """
+    if not queryset.query.where:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        # -1 means the table has never been analyzed
+        if row and row[0] >= 0:
+            return row[0]
+
+    plan = json.loads(queryset.order_by().explain(format='json'))
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def _encode_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset pagination over ``ordering`` (a tuple of non-null fields whose
+    last entry is unique, e.g. ``('-ratings_count', '-id')``).
+
+    Views can pick the ordering per request by defining
+    ``get_keyset_ordering(request)``. Paging is forward only.
+
+    page_queryset() and set_page() split a page into building the query and
+    recording its result, so async views can evaluate the query themselves.
+    """
+    ordering = ('-id',)
+    page_size = api_settings.PAGE_SIZE or 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count_estimate = None
+        if request.query_params.get(self.count_query_param) == 'estimate':
+            self.count_estimate = estimate_count(queryset)
+        return self.set_page(list(self.page_queryset(queryset, request, view)))
+
+    def page_queryset(self, queryset, request, view=None):
+        """The unevaluated query for the requested page (plus one lookahead row)."""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, view)
+
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self.after(position))
+
+        # One extra row tells us whether there is a next page
+        return queryset.order_by(*self.ordering)[:self.page_size + 1]
+
+    def set_page(self, rows):
+        """Record where the fetched rows end; returns the rows to serve."""
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.last_position = [self.field_value(rows[-1], field) for field in self.ordering] if rows else None
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_ordering(self, request, view):
+        if view is not None and hasattr(view, 'get_keyset_ordering'):
+            return tuple(view.get_keyset_ordering(request))
+        return tuple(self.ordering)
+
+    def field_value(self, obj, field):
+        return getattr(obj, field.lstrip('-'))
+
+    def after(self, position):
+        # (a, b, c) past (x, y, z) expands to
+        #   a <= x AND (a < x OR (a = x AND b < y) OR (a = x AND b = y AND c < z))
+        # for descending fields (and >= / > for ascending ones). The leading
+        # range lets Postgres do an index range scan instead of a filter.
+        condition = Q()
+        equal_so_far = Q()
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal_so_far & Q(**{f'{name}__{lookup}': value})
+            equal_so_far &= Q(**{name: value})
+        first = self.ordering[0]
+        leading = Q(**{f"{first.lstrip('-')}__{'lte' if first.startswith('-') else 'gte'}": position[0]})
+        return leading & condition
+
+    def encode_cursor(self, position):
+        payload = json.dumps([_encode_value(value) for value in position], separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+            if not isinstance(values, list) or len(values) != len(self.ordering):
+                raise ValueError
+            # Converted back through the model fields so dates and decimals compare correctly
+            return [
+                model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except Exception:
+            raise NotFound('Invalid cursor')
+
+    def get_next_link(self):
+        if not self.has_next or self.last_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.last_position))
+
+    def get_paginated_response(self, data):
+        payload = {'next': self.get_next_link()}
+        if self.count_estimate is not None:
+            payload['count_estimate'] = self.count_estimate
+        payload['results'] = data
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'count_estimate': {'type': 'integer'},
+                'results': schema,
+            },
+        }
+
+
+class RankedResultsPagination(LimitOffsetPagination):
+    """
+    Limit/offset for relevance-ordered results (search), where there is no
+    stable key to page by. Skips COUNT(*) and rejects offsets past max_offset.
+    """
+    default_limit = 20
+    max_limit = 100
+    max_offset = 1000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.page_queryset(queryset, request, view)))
+
+    def page_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.offset = self.get_offset(request)
+        if self.offset > self.max_offset:
+            # Serving a shallower page instead would label it with the wrong position
+            raise ValidationError({self.offset_query_param: f'Must be at most {self.max_offset}.'})
+        return queryset[self.offset:self.offset + self.limit + 1]
+
+    def set_page(self, rows):
+        self.has_next = len(rows) > self.limit and self.offset + self.limit <= self.max_offset
+        return rows[:self.limit]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(url, self.offset_query_param, self.offset + self.limit)
+
+    def get_previous_link(self):
+        if self.offset <= 0:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        if self.offset - self.limit <= 0:
+            return remove_query_param(url, self.offset_query_param)
+        return replace_query_param(url, self.offset_query_param, self.offset - self.limit)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,157 @@
+"""
+Full-text search over books.
+
+Book.search_vector holds the title (weight A) and the author names
+(weight B) as a tsvector with a GIN index. It is denormalised from the
+author join, so it is refreshed whenever a book, its author links or an
+author's name change (see libraryapi.signals).
+
+Queries match whole words and word prefixes through the tsvector, and fall
+back to pg_trgm word similarity on the title for typos.
+
+hybrid_search additionally embeds the query and merges the lexical
+candidates with the nearest books by vector (libraryapi.similarity.nearest)
+using reciprocal rank fusion.
+"""
+import re
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import Case, F, IntegerField, Q, Value, When
+
+from .models import Author, Book
+from .similarity import nearest
+from .utils import vectorizer
+
+SEARCH_CONFIG = 'english'
+
+_SEARCH_VECTOR_SQL = """
+UPDATE {book} b SET search_vector =
+    setweight(to_tsvector(%(config)s, coalesce(b.title, '')), 'A') ||
+    setweight(to_tsvector(%(config)s, coalesce((
+        SELECT string_agg(a.name, ' ')
+        FROM {author} a
+        JOIN {through} ba ON ba.author_id = a.id
+        WHERE ba.book_id = b.id
+    ), '')), 'B')
+WHERE {where}
+"""
+
+
+def _refresh(where, params, using=DEFAULT_DB_ALIAS):
+    db = connections[using]
+    qn = db.ops.quote_name
+    sql = _SEARCH_VECTOR_SQL.format(
+        book=qn(Book._meta.db_table),
+        author=qn(Author._meta.db_table),
+        through=qn(Book.authors.through._meta.db_table),
+        where=where,
+    )
+    with db.cursor() as cursor:
+        cursor.execute(sql, dict(params, config=SEARCH_CONFIG))
+
+
+def refresh_search_vectors(book_ids, using=DEFAULT_DB_ALIAS):
+    book_ids = [int(book_id) for book_id in book_ids]
+    if book_ids:
+        _refresh('b.id = ANY(%(book_ids)s)', {'book_ids': book_ids}, using)
+
+
+def refresh_author_search_vectors(author_id):
+    # Every book by this author embeds the author's name
+    through = connection.ops.quote_name(Book.authors.through._meta.db_table)
+    _refresh(
+        f'b.id IN (SELECT book_id FROM {through} WHERE author_id = %(author_id)s)',
+        {'author_id': int(author_id)},
+    )
+
+
+def _prefix_query(text):
+    # Every word must match, the last one as a prefix so "lord of the ri"
+    # already finds "Lord of the Rings". Only \w+ tokens reach to_tsquery.
+    terms = re.findall(r'\w+', text)
+    if not terms:
+        return None
+    terms[-1] += ':*'
+    return SearchQuery(' & '.join(terms), search_type='raw', config=SEARCH_CONFIG)
+
+
+def search_books(queryset, text):
+    """Filter ``queryset`` to books matching ``text``, best matches first."""
+    query = _prefix_query(text)
+    if query is None:
+        return queryset.none()
+
+    return queryset.annotate(
+        rank=SearchRank(F('search_vector'), query),
+        title_similarity=TrigramWordSimilarity(text, 'title'),
+    ).filter(
+        Q(search_vector=query) | Q(title__trigram_word_similar=text)
+    ).order_by('-rank', '-title_similarity', 'id')
+
+
+def _hybrid_setting(name, default):
+    return getattr(settings, 'HYBRID_SEARCH', {}).get(name, default)
+
+
+@lru_cache(maxsize=_hybrid_setting('QUERY_CACHE_SIZE', 1024))
+def _cached_query_vector(normalized_text):
+    vector = vectorizer.generate_query_vector(normalized_text)
+    # Shared between requests, so make sure nobody modifies it in place
+    vector.setflags(write=False)
+    return vector
+
+
+def embed_query(text):
+    """Embedding for a search query; repeated queries skip inference."""
+    return _cached_query_vector(' '.join(text.lower().split()))
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Merge ranked id lists: each list adds 1 / (k + rank) to an id's score."""
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def hybrid_search(queryset, text, query_vector=None):
+    """
+    Lexical + semantic search over ``queryset``.
+
+    Returns ``(queryset, timings)`` where the queryset is ordered by fused
+    rank and ``timings`` maps each stage to its duration in milliseconds.
+    Callers that already embedded ``text`` can pass ``query_vector``.
+    """
+    candidates = _hybrid_setting('CANDIDATES', 100)
+    timings = {}
+
+    started = time.perf_counter()
+    lexical_ids = list(search_books(queryset, text).values_list('id', flat=True)[:candidates])
+    timings['lexical'] = (time.perf_counter() - started) * 1000
+
+    if query_vector is None:
+        started = time.perf_counter()
+        query_vector = embed_query(text)
+        timings['embed'] = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    # nearest() widens ef_search (and the re-rank pool) to cover every candidate
+    semantic_ids = [row['id'] for row in nearest(queryset, query_vector, ('id',), limit=candidates)]
+    timings['semantic'] = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    fused_ids = reciprocal_rank_fusion([lexical_ids, semantic_ids], k=_hybrid_setting('RRF_K', 60))
+    timings['fusion'] = (time.perf_counter() - started) * 1000
+
+    if not fused_ids:
+        return queryset.none(), timings
+    ordering = Case(
+        *[When(id=book_id, then=Value(position)) for position, book_id in enumerate(fused_ids)],
+        output_field=IntegerField(),
+    )
+    return queryset.filter(id__in=fused_ids).order_by(ordering), timings
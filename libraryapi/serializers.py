@@ -1,6 +1,7 @@
 from django.contrib.auth.models import User
 from rest_framework import serializers
-from .models import Author, UserFavorite, Book
+from rest_framework.permissions import SAFE_METHODS
+from .models import Author, AuthorAggregate, UserFavorite, Book
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -13,15 +14,75 @@ class UserSerializer(serializers.ModelSerializer):
         user = User.objects.create_user(**validated_data)
         return user
 
-class AuthorSerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """
+    Lets clients ask for a subset of fields with ``?fields=id,title``.
+    Unknown names are ignored; without the parameter every field is returned.
+    Only applies to reads, so a write is always validated against every field.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS:
+            return
+        requested = requested_fields(request)
+        if requested:
+            for name in set(self.fields) - requested:
+                self.fields.pop(name)
+
+
+def requested_fields(request):
+    if request is None:
+        return None
+    fields = request.query_params.get('fields')
+    if not fields:
+        return None
+    return {name.strip() for name in fields.split(',') if name.strip()}
+
+
+class AuthorSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Author
+        fields = ['id', 'name']
+
+class AuthorAggregateSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AuthorAggregate
+        fields = ['book_count', 'ratings_count', 'text_reviews_count', 'average_rating', 'updated_at']
+
+class AuthorListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    # Computed from the author's books in the catalogue (libraryapi.aggregates)
+    stats = AuthorAggregateSerializer(source='aggregate', read_only=True, allow_null=True)
+
+    class Meta:
+        model = Author
+        exclude = ['about']
+
+class AuthorSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    stats = AuthorAggregateSerializer(source='aggregate', read_only=True, allow_null=True)
+
     class Meta:
         model = Author
         fields = '__all__'
 
-class BookSerializer(serializers.ModelSerializer):
+class BookListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    # Names come from a prefetch, so a page costs one extra query instead of one per book
+    authors = AuthorSummarySerializer(many=True, read_only=True)
+
     class Meta:
         model = Book
-        fields = '__all__'
+        fields = [
+            'id', 'title', 'authors', 'language', 'average_rating', 'ratings_count',
+            'publication_date', 'format', 'image_url', 'publisher', 'num_pages', 'vector_status',
+        ]
+
+class BookSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Book
+        exclude = ['search_vector', 'content_hash']
+        # Only ever computed from title + description (see BookViewSet.update)
+        read_only_fields = ['vector', 'vector_status', 'vector_model']
 
 class UserFavoriteSerializer(serializers.ModelSerializer):
     book = serializers.PrimaryKeyRelatedField(queryset=Book.objects.all())
@@ -29,4 +90,16 @@ class UserFavoriteSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserFavorite
         fields = ['id', 'user', 'book', 'added_on']
-        read_only_fields = ['user', 'added_on']
\ No newline at end of file
+        read_only_fields = ['user', 'added_on']
+
+
+class BookBulkSerializer(BookSerializer):
+    """
+    One item of POST/PATCH /api/books/bulk/. Author ids are checked for the
+    whole batch in one query (libraryapi.bulk) rather than one per id, and
+    vectors are computed by the endpoint.
+    """
+    authors = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+
+    class Meta(BookSerializer.Meta):
+        read_only_fields = ['vector', 'vector_status', 'vector_model', 'rating_distribution']
@@ -0,0 +1,199 @@
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from .aggregates import refresh_author_aggregates, refresh_book_author_aggregates
+from .cache import invalidate
+from .favorites import rebuild_profiles
+from .models import Author, Book, BookNeighbors, RatingDistribution, UserFavorite
+from .search import refresh_author_search_vectors, refresh_search_vectors
+from .similarity import uses_vector_store, vector_store
+from .vector_store import VectorStoreUnavailable
+
+# Sent by bulk write paths (bulk_create, COPY, queryset.update) that bypass
+# the per-instance model signals. Receives ``book_ids`` and optionally the
+# database alias they were written through as ``using`` and the
+# ``author_ids`` that lost links to those books.
+books_bulk_saved = Signal()
+
+# Sent after new vectors are stored (libraryapi.embedding_queue). Receives
+# ``book_ids`` and the matching ``vectors``.
+book_vectors_saved = Signal()
+
+
+@receiver(post_save, sender=Book)
+def book_saved(sender, instance, using, **kwargs):
+    refresh_search_vectors([instance.pk], using=using)
+
+
+@receiver(m2m_changed, sender=Book.authors.through)
+def book_authors_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        if action == 'pre_clear' and reverse:
+            # After the clear there is no way left to tell which books were linked
+            instance._cleared_book_ids = list(instance.books.values_list('pk', flat=True))
+        return
+
+    if not reverse:
+        refresh_search_vectors([instance.pk])
+    elif action == 'post_clear':
+        refresh_search_vectors(getattr(instance, '_cleared_book_ids', []))
+    else:
+        refresh_search_vectors(pk_set or [])
+
+
+@receiver(m2m_changed, sender=Book.authors.through)
+def book_authors_changed_touch(sender, instance, action, reverse, pk_set, **kwargs):
+    # Author links are part of the export, so they count as a change to the book
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        book_ids = [instance.pk]
+    else:
+        book_ids = pk_set or getattr(instance, '_cleared_book_ids', [])
+    Book.objects.filter(pk__in=book_ids).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Author)
+def author_saved(sender, instance, created, update_fields=None, **kwargs):
+    # A new author has no books yet; otherwise only a name change matters
+    if created or (update_fields is not None and 'name' not in update_fields):
+        return
+    refresh_author_search_vectors(instance.pk)
+
+
+@receiver(books_bulk_saved)
+def books_bulk_saved_search(sender, book_ids, using=DEFAULT_DB_ALIAS, **kwargs):
+    # Same connection as the writer, which may not have committed yet
+    refresh_search_vectors(book_ids, using=using)
+
+
+# Response cache invalidation (see libraryapi.cache)
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def book_changed_cache(sender, instance, using, **kwargs):
+    invalidate('book', [instance.pk], using=using)
+
+
+@receiver(m2m_changed, sender=Book.authors.through)
+def book_authors_changed_cache(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        invalidate('book', [instance.pk], using=using)
+    else:
+        invalidate('book', pk_set or getattr(instance, '_cleared_book_ids', []), using=using)
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+def author_changed_cache(sender, instance, using, **kwargs):
+    invalidate('author', [instance.pk], using=using)
+    # Book list pages show author names
+    invalidate('book', using=using)
+
+
+@receiver(post_save, sender=RatingDistribution)
+@receiver(post_delete, sender=RatingDistribution)
+def rating_distribution_changed_cache(sender, instance, using, **kwargs):
+    book_id = Book.objects.using(using).filter(rating_distribution=instance.pk).values_list('pk', flat=True).first()
+    if book_id is not None:
+        invalidate('book', [book_id], using=using)
+
+
+@receiver(books_bulk_saved)
+def books_bulk_saved_cache(sender, book_ids, using=DEFAULT_DB_ALIAS, **kwargs):
+    invalidate('book', book_ids, using=using)
+
+
+# Memory-mapped similarity backend deltas (see libraryapi.vector_store)
+
+@receiver(book_vectors_saved)
+def book_vectors_saved_store(sender, book_ids, vectors, **kwargs):
+    if not uses_vector_store():
+        return
+    try:
+        vector_store().append(book_ids, vectors)
+    except VectorStoreUnavailable:
+        # Nothing exported yet; the first export_vectors picks these up
+        pass
+
+
+@receiver(post_delete, sender=Book)
+def book_deleted_store(sender, instance, **kwargs):
+    if not uses_vector_store():
+        return
+    try:
+        vector_store().tombstone([instance.pk])
+    except VectorStoreUnavailable:
+        pass
+
+
+@receiver(book_vectors_saved)
+def book_vectors_saved_neighbors(sender, book_ids, **kwargs):
+    # The precomputed list no longer matches the new vector; serve live results until the next run
+    BookNeighbors.objects.filter(book_id__in=book_ids).delete()
+
+
+# Favorites removed by a cascade (e.g. a deleted book) don't go through
+# libraryapi.favorites, which deletes with raw SQL; keep the profile's
+# counter and mean in step here
+
+@receiver(post_delete, sender=UserFavorite)
+def favorite_deleted_profile(sender, instance, **kwargs):
+    # A user being deleted has no profile left to rebuild
+    rebuild_profiles([instance.user_id])
+
+
+@receiver(book_vectors_saved)
+def book_vectors_saved_profiles(sender, book_ids, **kwargs):
+    # Profiles averaged the old vectors (or none, for books that were pending)
+    rebuild_profiles(
+        UserFavorite.objects.filter(book_id__in=list(book_ids)).values_list('user_id', flat=True).distinct()
+    )
+
+
+# Author aggregates (see libraryapi.aggregates)
+
+@receiver(post_save, sender=Book)
+def book_saved_aggregates(sender, instance, using, **kwargs):
+    refresh_book_author_aggregates([instance.pk], using=using)
+
+
+@receiver(pre_delete, sender=Book)
+def book_deleting_aggregates(sender, instance, **kwargs):
+    # The links are gone by post_delete
+    instance._author_ids = list(instance.authors.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Book)
+def book_deleted_aggregates(sender, instance, using, **kwargs):
+    refresh_author_aggregates(getattr(instance, '_author_ids', []), using=using)
+
+
+@receiver(m2m_changed, sender=Book.authors.through)
+def book_authors_changed_aggregates(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if action == 'pre_clear' and not reverse:
+        instance._cleared_author_ids = list(instance.authors.values_list('pk', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        refresh_author_aggregates([instance.pk], using=using)
+    elif action == 'post_clear':
+        refresh_author_aggregates(getattr(instance, '_cleared_author_ids', []), using=using)
+    else:
+        refresh_author_aggregates(pk_set or [], using=using)
+
+
+@receiver(post_save, sender=Author)
+def author_created_aggregates(sender, instance, created, using, **kwargs):
+    if created:
+        refresh_author_aggregates([instance.pk], using=using)
+
+
+@receiver(books_bulk_saved)
+def books_bulk_saved_aggregates(sender, book_ids, using=DEFAULT_DB_ALIAS, author_ids=(), **kwargs):
+    refresh_book_author_aggregates(book_ids, using=using)
+    refresh_author_aggregates(author_ids, using=using)
@@ -0,0 +1,168 @@
+"""
+Nearest-neighbour queries over Book.vector.
+
+Queries order by L2 distance so they can use the approximate index created
+in migration 0013 (HNSW or IVFFlat, see settings.VECTOR_INDEX). The index
+trades recall for speed; ef_search (HNSW) and probes (IVFFlat) are set per
+transaction so callers can ask for more recall when they need it.
+
+The index can also be built over a compact form of the vector
+(VECTOR_INDEX['QUANTIZATION']): ``halfvec`` (16-bit floats, half the size)
+or ``binary`` (one bit per dimension, 1/32 of the size). The table keeps
+the full float32 vectors, so searches then run in two phases: the compact
+index picks RERANK_CANDIDATES books and those are re-ranked by exact L2
+distance.
+
+With settings.SIMILARITY_BACKEND = 'mmap', nearest_books is answered from
+the memory-mapped vector store (libraryapi.vector_store) instead, and only
+the titles are read from Postgres.
+"""
+import logging
+from contextlib import contextmanager
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+from pgvector.django import L2Distance, VectorField
+
+from .models import Book
+from .vector_store import VectorStore, VectorStoreUnavailable
+
+logger = logging.getLogger(__name__)
+
+VECTOR_INDEX_NAME = 'libraryapi_book_vector_ann_idx'
+
+# pgvector rejects larger hnsw.ef_search values
+MAX_EF_SEARCH = 1000
+
+# quantization -> (indexed expression, operator, operator class). Queries have
+# to order by exactly the indexed expression for Postgres to use the index.
+QUANTIZATIONS = {
+    'none': ('{column}', '<->', 'vector_l2_ops'),
+    'halfvec': ('({column}::halfvec({dims}))', '<->', 'halfvec_l2_ops'),
+    'binary': ('(binary_quantize({column})::bit({dims}))', '<~>', 'bit_hamming_ops'),
+}
+
+
+def _index_setting(name, default=None):
+    return getattr(settings, 'VECTOR_INDEX', {}).get(name, default)
+
+
+def _quantized(expression, quantization):
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f'Unsupported vector quantization: {quantization!r}')
+    return QUANTIZATIONS[quantization][0].format(
+        column=expression, dims=Book._meta.get_field('vector').dimensions,
+    )
+
+
+def uses_vector_store():
+    return getattr(settings, 'SIMILARITY_BACKEND', 'postgres') == 'mmap'
+
+
+@lru_cache(maxsize=None)
+def vector_store():
+    store_settings = getattr(settings, 'VECTOR_STORE', {})
+    return VectorStore(store_settings.get('PATH', 'vector_store'), store_settings.get('REFRESH_SECONDS', 5))
+
+
+def vector_index_sql(method='hnsw', m=16, ef_construction=64, lists=1000, concurrently=False,
+                     quantization='none', name=VECTOR_INDEX_NAME):
+    """CREATE INDEX statement for the Book.vector ANN index."""
+    if method == 'hnsw':
+        options = f'WITH (m = {int(m)}, ef_construction = {int(ef_construction)})'
+    elif method == 'ivfflat':
+        options = f'WITH (lists = {int(lists)})'
+    else:
+        raise ValueError(f'Unsupported vector index method: {method!r}')
+    expression = _quantized('vector', quantization)
+    return (
+        f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}{name} "
+        f'ON {Book._meta.db_table} USING {method} ({expression} {QUANTIZATIONS[quantization][2]}) {options}'
+    )
+
+
+def coarse_distance(vector, quantization):
+    """Distance between Book.vector and ``vector`` in the indexed compact form."""
+    value = VectorField().get_prep_value(vector)
+    column = f'{connection.ops.quote_name(Book._meta.db_table)}.{connection.ops.quote_name("vector")}'
+    operator = QUANTIZATIONS[quantization][1]
+    return RawSQL(
+        f'{_quantized(column, quantization)} {operator} {_quantized("%s::vector", quantization)}',
+        [value],
+        output_field=FloatField(),
+    )
+
+
+@contextmanager
+def ann_search(ef_search=None, probes=None):
+    """
+    Run the enclosed queries in a transaction with the ANN search knobs set.
+
+    SET LOCAL only lasts until the end of the transaction, so the values
+    never leak to other requests sharing the connection.
+    """
+    ef_search = ef_search or _index_setting('EF_SEARCH', 40)
+    probes = probes or _index_setting('PROBES', 10)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('SELECT set_config(%s, %s, true), set_config(%s, %s, true)', [
+            'hnsw.ef_search', str(int(ef_search)),
+            'ivfflat.probes', str(int(probes)),
+        ])
+        yield
+
+
+def nearest(queryset, vector, fields, limit=5, offset=0, ef_search=None, probes=None,
+            quantization=None, rerank_candidates=None, exclude_ids=()):
+    """
+    Rows of ``queryset`` closest to ``vector`` as ``values(*fields)`` dicts,
+    closest first. ``similarity`` (the L2 distance) is available as a field.
+    """
+    quantization = quantization or _index_setting('QUANTIZATION', 'none')
+    queryset = queryset.filter(vector__isnull=False)
+    if exclude_ids:
+        queryset = queryset.exclude(id__in=exclude_ids)
+    depth = offset + limit
+
+    if quantization != 'none':
+        # Phase 1: candidates from the compact index; phase 2 re-ranks them exactly
+        depth = max(rerank_candidates or _index_setting('RERANK_CANDIDATES', 100), depth)
+        candidates = queryset.order_by(coarse_distance(vector, quantization)).values('id')[:depth]
+        queryset = queryset.model.objects.filter(id__in=candidates)
+
+    queryset = queryset.annotate(
+        similarity=L2Distance('vector', vector)
+    ).order_by('similarity')[offset:offset + limit]
+
+    # An HNSW scan returns at most ef_search rows, so it has to cover every row we
+    # need plus the excluded ones, which are only filtered out after the scan
+    scan_depth = depth + len(exclude_ids)
+    ef_search = min(max(ef_search or _index_setting('EF_SEARCH', 40), scan_depth), MAX_EF_SEARCH)
+    with ann_search(ef_search=ef_search, probes=probes):
+        return list(queryset.values(*fields))
+
+
+def nearest_books(vector, exclude_ids=(), limit=5, offset=0, ef_search=None, probes=None):
+    """
+    Return the books closest to ``vector`` as dicts with ``id``, ``title``
+    and ``similarity`` (the L2 distance, lower is closer).
+    """
+    if uses_vector_store():
+        try:
+            book_ids, distances = vector_store().search(vector, limit=limit, offset=offset, exclude_ids=exclude_ids)
+        except VectorStoreUnavailable as e:
+            logger.warning('%s; falling back to Postgres', e)
+        else:
+            titles = dict(Book.objects.filter(id__in=book_ids).values_list('id', 'title'))
+            # Books deleted since the last refresh are simply dropped
+            return [
+                {'id': book_id, 'title': titles[book_id], 'similarity': distance}
+                for book_id, distance in zip(book_ids, distances) if book_id in titles
+            ]
+
+    return nearest(
+        Book.objects.all(), vector, ('id', 'title', 'similarity'),
+        limit=limit, offset=offset, ef_search=ef_search, probes=probes, exclude_ids=exclude_ids,
+    )
@@ -1,3 +1,374 @@
-from django.test import TestCase
+import io
+import operator
+import os
+import tempfile
+from datetime import date
+from decimal import Decimal
+from itertools import product
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.core.cache import caches
+from django.db import connection
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.test import SimpleTestCase, override_settings
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+
+from . import loaders, signals, similarity, utils
+from .cache import CachedResponseMixin, bump_version
+from .ingestion import Checkpoint, read_line_chunks
+from .models import Author, Book, UserTasteProfile
+from .pagination import KeysetPagination
+from .filters import non_null_ordering_filters
+from .search import reciprocal_rank_fusion
+from .vector_store import VectorStore
+from .views import get_limit_offset
+
+LOOKUPS = {'lt': operator.lt, 'lte': operator.le, 'gt': operator.gt, 'gte': operator.ge}
+
+
+def matches(q, row):
+    """Evaluate a Q of exact/lt/lte/gt/gte lookups against a dict, like the database would."""
+    results = []
+    for child in q.children:
+        if isinstance(child, Q):
+            results.append(matches(child, row))
+        else:
+            lookup, value = child
+            name, _, op = lookup.partition('__')
+            results.append(LOOKUPS[op](row[name], value) if op else row[name] == value)
+    result = all(results) if q.connector == Q.AND else any(results)
+    return not result if q.negated else result
+
+
+def sort_key(ordering):
+    # Descending fields are negated; only used with numbers and dates turned into ordinals
+    def key(row):
+        values = []
+        for field in ordering:
+            value = row[field.lstrip('-')]
+            value = value.toordinal() if isinstance(value, date) else value
+            values.append(-value if field.startswith('-') else value)
+        return values
+    return key
+
+
+class KeysetPaginationTests(SimpleTestCase):
+    def paginator(self, ordering):
+        paginator = KeysetPagination()
+        paginator.ordering = ordering
+        return paginator
+
+    def request(self, cursor):
+        return Request(APIRequestFactory().get('/api/books/', {'cursor': cursor}))
+
+    def assert_after_follows_ordering(self, ordering, rows):
+        paginator = self.paginator(ordering)
+        rows = sorted(rows, key=sort_key(ordering))
+        for index, row in enumerate(rows):
+            position = [row[field.lstrip('-')] for field in ordering]
+            after = [other for other in rows if matches(paginator.after(position), other)]
+            self.assertEqual(after, rows[index + 1:], f'after {position}')
+
+    def test_after_descending_with_ties(self):
+        rows = [
+            {'ratings_count': count, 'id': book_id}
+            for book_id, count in enumerate([5, 3, 5, 1, 3, 5, 0], start=1)
+        ]
+        self.assert_after_follows_ordering(('-ratings_count', '-id'), rows)
+
+    def test_after_ascending(self):
+        rows = [{'ratings_count': count, 'id': book_id} for book_id, count in enumerate([2, 2, 1, 7], start=1)]
+        self.assert_after_follows_ordering(('ratings_count', 'id'), rows)
+
+    def test_after_three_columns_with_dates_and_decimals(self):
+        rows = [
+            {'publication_date': day, 'average_rating': rating, 'id': book_id}
+            for book_id, (day, rating) in enumerate(
+                product([date(2001, 1, 1), date(1999, 5, 2)], [Decimal('4.10'), Decimal('3.95')]), start=1
+            )
+        ]
+        rows += [dict(row, id=row['id'] + 10) for row in rows]
+        self.assert_after_follows_ordering(('-publication_date', '-average_rating', '-id'), rows)
+
+    def test_after_leads_with_a_range_on_the_first_column(self):
+        q = self.paginator(('-ratings_count', '-id')).after([10, 4])
+        self.assertIn(('ratings_count__lte', 10), q.children)
+
+    def test_nullable_ordering_columns_are_filtered(self):
+        self.assertEqual(
+            non_null_ordering_filters(Book, ('-publication_date', '-id')), {'publication_date__isnull': False},
+        )
+        self.assertEqual(non_null_ordering_filters(Book, ('ratings_count', 'id')), {})
+
+    def test_cursor_round_trip_restores_dates_and_decimals(self):
+        paginator = self.paginator(('-publication_date', '-average_rating', '-id'))
+        position = [date(2004, 2, 29), Decimal('4.25'), 42]
+        cursor = paginator.encode_cursor(position)
+        self.assertNotIn('=', cursor)
+        self.assertEqual(paginator.decode_cursor(self.request(cursor), Book), position)
+
+    def test_missing_cursor_is_first_page(self):
+        request = Request(APIRequestFactory().get('/api/books/'))
+        self.assertIsNone(self.paginator(('-id',)).decode_cursor(request, Book))
+
+    def test_invalid_cursors_are_rejected(self):
+        paginator = self.paginator(('-ratings_count', '-id'))
+        wrong_length = paginator.encode_cursor([1])
+        for cursor in ['not base64!', wrong_length, paginator.encode_cursor(['x', 1])]:
+            with self.assertRaises(NotFound):
+                paginator.decode_cursor(self.request(cursor), Book)
+
+
+class UserTasteProfileTests(SimpleTestCase):
+    def test_add_keeps_running_mean(self):
+        profile = UserTasteProfile()
+        profile.add_favorite([1.0, 0.0])
+        profile.add_favorite([0.0, 1.0])
+        profile.add_favorite([2.0, 2.0])
+        np.testing.assert_allclose(profile.vector, [1.0, 1.0])
+        self.assertEqual((profile.favorite_count, profile.vector_count), (3, 3))
+
+    def test_books_without_vectors_only_count_as_favorites(self):
+        profile = UserTasteProfile()
+        profile.add_favorite(None)
+        self.assertIsNone(profile.vector)
+        profile.add_favorite([3.0, 1.0])
+        np.testing.assert_allclose(profile.vector, [3.0, 1.0])
+        self.assertEqual((profile.favorite_count, profile.vector_count), (2, 1))
+
+    def test_remove_rebuilds_from_remaining_favorites(self):
+        profile = UserTasteProfile()
+        profile.add_favorite([1.0, 0.0])
+        # A pending book, embedded by the time it is removed
+        profile.add_favorite(None)
+        profile.remove_favorite([[1.0, 0.0]])
+        np.testing.assert_allclose(profile.vector, [1.0, 0.0])
+        self.assertEqual((profile.favorite_count, profile.vector_count), (1, 1))
+
+    def test_removing_the_last_vector_clears_the_mean(self):
+        profile = UserTasteProfile()
+        profile.add_favorite([1.0, 2.0])
+        profile.add_favorite(None)
+        profile.remove_favorite([None])
+        self.assertIsNone(profile.vector)
+        self.assertEqual((profile.favorite_count, profile.vector_count), (1, 0))
+
+
+class ReciprocalRankFusionTests(SimpleTestCase):
+    def test_items_in_both_rankings_come_first(self):
+        self.assertEqual(reciprocal_rank_fusion([[1, 2, 3], [3, 4]]), [3, 1, 2, 4])
+
+    def test_single_ranking_keeps_its_order(self):
+        self.assertEqual(reciprocal_rank_fusion([[5, 9, 2]]), [5, 9, 2])
+
+    def test_k_damps_rank_differences(self):
+        # Rank 1 + rank 4 beats rank 2 + rank 2 when k is small, not when it is large
+        rankings = [[1, 2, 3, 4], [4, 2, 3, 1]]
+        self.assertEqual(reciprocal_rank_fusion(rankings, k=0)[:2], [1, 4])
+        self.assertEqual(reciprocal_rank_fusion([[1, 2, 3], [2, 3, 1]], k=60)[0], 2)
+
+    def test_empty(self):
+        self.assertEqual(reciprocal_rank_fusion([[], []]), [])
+
+
+class ReadLineChunksTests(SimpleTestCase):
+    LINES = [f'{{"n": {n}}}\n'.encode() for n in range(10)]
+
+    def stream(self):
+        return io.BytesIO(b''.join(self.LINES))
+
+    def test_chunks_cover_every_line_with_positions(self):
+        chunks = list(read_line_chunks(self.stream(), 4))
+        self.assertEqual([(c.start_line, c.end_line) for c in chunks], [(0, 4), (4, 8), (8, 10)])
+        self.assertEqual([line for c in chunks for line in c.lines], self.LINES)
+        self.assertEqual([c.end_offset for c in chunks], [sum(map(len, self.LINES[:c.end_line])) for c in chunks])
+
+    def test_resume_from_checkpoint_offset_yields_the_remaining_lines(self):
+        first, second, *_ = read_line_chunks(self.stream(), 3)
+        resumed = list(read_line_chunks(self.stream(), 3, start_line=first.end_line, start_offset=first.end_offset))
+        self.assertEqual([line for c in resumed for line in c.lines], self.LINES[3:])
+        self.assertEqual(resumed[0], second)
+        self.assertEqual(resumed[-1].end_line, len(self.LINES))
+
+    def test_start_line_without_offset_skips_lines(self):
+        resumed = list(read_line_chunks(self.stream(), 4, start_line=6))
+        self.assertEqual([line for c in resumed for line in c.lines], self.LINES[6:])
+        self.assertEqual((resumed[0].start_line, resumed[0].end_line), (6, 10))
+        self.assertEqual(resumed[0].end_offset, sum(map(len, self.LINES)))
+
+    def test_resume_at_end_yields_nothing(self):
+        *_, last = read_line_chunks(self.stream(), 4)
+        self.assertEqual(list(read_line_chunks(self.stream(), 4, last.end_line, last.end_offset)), [])
+
+    def test_resume_through_a_saved_checkpoint(self):
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = Checkpoint(os.path.join(directory, 'seed.json'))
+            self.assertIsNone(checkpoint.load())
+
+            chunks = read_line_chunks(self.stream(), 4)
+            chunk = next(chunks)
+            checkpoint.save(member='books.json', line=chunk.end_line, byte_offset=chunk.end_offset)
+
+            state = checkpoint.load()
+            self.assertEqual((state['line'], state['byte_offset']), (4, chunk.end_offset))
+            self.assertFalse(os.path.exists(f'{checkpoint.path}.tmp'))
+            resumed = read_line_chunks(self.stream(), 4, state['line'], state['byte_offset'])
+            self.assertEqual([line for c in resumed for line in c.lines], self.LINES[4:])
+
+
+@mock.patch.multiple(
+    signals, refresh_search_vectors=mock.DEFAULT, invalidate=mock.DEFAULT,
+    refresh_author_aggregates=mock.DEFAULT, refresh_book_author_aggregates=mock.DEFAULT,
+)
+class AuthorAggregateSignalTests(SimpleTestCase):
+    def test_book_saved_refreshes_its_authors(self, refresh_book_author_aggregates, **mocks):
+        post_save.send(sender=Book, instance=Book(pk=7), created=False, using='default')
+        refresh_book_author_aggregates.assert_called_once_with([7], using='default')
+
+    def test_book_deleted_refreshes_its_former_authors(self, refresh_author_aggregates, **mocks):
+        book = Book(pk=7)
+        # As captured by the pre_delete receiver
+        book._author_ids = [3, 4]
+        post_delete.send(sender=Book, instance=book, using='default')
+        refresh_author_aggregates.assert_called_once_with([3, 4], using='default')
+
+    def test_author_created_gets_a_row(self, refresh_author_aggregates, **mocks):
+        post_save.send(sender=Author, instance=Author(pk=5), created=True, using='default')
+        refresh_author_aggregates.assert_called_once_with([5], using='default')
+
+    def test_bulk_save_refreshes_books_and_unlinked_authors(
+        self, refresh_author_aggregates, refresh_book_author_aggregates, **mocks
+    ):
+        signals.books_bulk_saved.send(sender=Book, book_ids=[1, 2], author_ids=[9])
+        refresh_book_author_aggregates.assert_called_once_with([1, 2], using='default')
+        refresh_author_aggregates.assert_called_once_with([9], using='default')
+
+
+class NearestNeighbourDepthTests(SimpleTestCase):
+    def request(self, **params):
+        return Request(APIRequestFactory().get('/api/recommendations/', params))
+
+    def test_limit_and_offset_within_max_offset(self):
+        self.assertEqual(get_limit_offset(self.request(limit=500, offset=900)), (100, 900))
+
+    def test_offset_past_max_offset_is_rejected(self):
+        for params in [{'offset': 1000}, {'offset': 995, 'limit': 10}]:
+            with self.assertRaises(ValidationError):
+                get_limit_offset(self.request(**params))
+
+    def ef_search(self, **kwargs):
+        # Stop before the query runs; only the scan depth matters here
+        with mock.patch.object(similarity, 'ann_search', side_effect=RuntimeError) as ann_search:
+            with self.assertRaises(RuntimeError):
+                similarity.nearest(Book.objects.all(), [0.0] * 384, ('id',), **kwargs)
+        return ann_search.call_args.kwargs['ef_search']
+
+    def test_ef_search_covers_the_page(self):
+        self.assertEqual(self.ef_search(limit=100, offset=200, quantization='none'), 300)
+
+    def test_ef_search_covers_excluded_books(self):
+        self.assertEqual(self.ef_search(limit=50, offset=0, quantization='none', exclude_ids=list(range(20))), 70)
+
+    def test_ef_search_is_clamped(self):
+        self.assertEqual(self.ef_search(limit=100, offset=5000, quantization='none'), similarity.MAX_EF_SEARCH)
+        self.assertEqual(self.ef_search(limit=10, quantization='binary', rerank_candidates=4000), similarity.MAX_EF_SEARCH)
+
+
+class InsertWithFallbackTests(SimpleTestCase):
+    def test_malformed_row_is_reported_and_the_rest_inserted(self):
+        inserted = []
+        field = Author._meta.get_field('average_rating')
+
+        def insert(payloads):
+            # Converting the value is enough to hit the error a real insert would
+            values = [field.get_db_prep_save(payload, connection) for payload in payloads]
+            inserted.extend(values)
+
+        rows = [('first', '4.10'), ('malformed', 'n/a'), ('last', 3)]
+        with mock.patch.object(loaders.transaction, 'atomic'):
+            inserted_count, errors = loaders._insert_with_fallback(rows, insert)
+
+        self.assertEqual(inserted_count, 2)
+        self.assertEqual([label for label, _ in errors], ['malformed'])
+        self.assertEqual(inserted, [Decimal('4.10'), Decimal('3')])
+
+
+class VectorStoreGenerationTests(SimpleTestCase):
+    def export(self, store, rows):
+        return store.export(iter(rows), len(rows), 2)
+
+    def test_snapshot_follows_current_when_the_read_generation_was_removed(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = VectorStore(directory, refresh_seconds=0)
+            self.export(store, [(1, [1.0, 0.0])])
+            _, previous = self.export(store, [(1, [1.0, 0.0]), (2, [0.0, 1.0])])
+            current = store._current_directory()
+            store.remove_generation(previous)
+
+            # CURRENT was read just before export_vectors switched it and removed the old files
+            with mock.patch.object(store, '_current_directory', side_effect=[previous, current]):
+                snapshot = store.snapshot()
+            self.assertEqual(snapshot.directory, current)
+            self.assertEqual(store.search([0.0, 1.0], limit=1)[0], [2])
+
+
+class BookVectorizerTests(SimpleTestCase):
+    def encode_with(self, vectors):
+        model = mock.Mock(**{'encode.return_value': np.asarray(vectors, dtype=np.float32)})
+        return mock.patch.object(utils, 'registry', mock.MagicMock(**{'get.return_value': model}))
+
+    def test_vectors_of_the_stored_width(self):
+        with self.encode_with(np.zeros((2, 384))):
+            vectors = utils.BookVectorizer('test-model').generate_vectors(['a', 'b'], ['', ''])
+        self.assertEqual(vectors.shape, (2, 384))
+
+    def test_model_of_another_width_is_an_error(self):
+        with self.encode_with(np.zeros((2, 768))), self.assertRaises(ValueError):
+            utils.BookVectorizer('test-model').generate_vectors(['a', 'b'], ['', ''])
+
+    def test_no_texts(self):
+        self.assertEqual(utils.BookVectorizer('test-model').generate_vectors([], []).shape, (0, 384))
+
+
+class RenderCounter:
+    renders = 0
+
+    def list(self, request, *args, **kwargs):
+        self.renders += 1
+        return Response({'renders': self.renders})
+
+
+class CountedView(CachedResponseMixin, RenderCounter):
+    cache_namespace = 'test'
+
+
+@override_settings(RESPONSE_CACHE={'ALIAS': 'default', 'SHARED': False, 'LOCAL_TIMEOUT': 60})
+class LocalResponseCacheTests(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.view = CountedView()
+
+    def get(self, **headers):
+        request = Request(APIRequestFactory().get('/api/books/', **headers))
+        request.accepted_media_type = 'application/json'
+        return self.view.list(request)
+
+    def test_bodies_are_cached_per_process(self):
+        first, second = self.get(), self.get()
+        self.assertEqual((first.data, second.data), ({'renders': 1}, {'renders': 1}))
+        self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_etag_revalidates(self):
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_version_bump_renders_again(self):
+        etag = self.get()['ETag']
+        bump_version('test')
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response.data), (200, {'renders': 2}))
@@ -1,6 +1,7 @@
 from django.urls import path, include
-from .views import RegisterView, LoginView, AuthorViewSet, BookViewSet, UserFavoriteViewSet
+from .views import RegisterView, LoginView, AuthorViewSet, BookViewSet, UserFavoriteViewSet, RecommendationView
 from rest_framework.routers import DefaultRouter
+from . import async_views
 
 router = DefaultRouter()
 router.register(r'authors', AuthorViewSet)
@@ -11,4 +12,9 @@ urlpatterns = [
     path('', include(router.urls)),
     path('register', RegisterView.as_view(), name='register'),
     path('login', LoginView.as_view(), name='login'),
+    path('recommendations', RecommendationView.as_view(), name='recommendations'),
+    # Async read path, for ASGI deployments (libraryapi.async_views)
+    path('async/books/', async_views.book_list, name='async-book-list'),
+    path('async/books/<int:pk>/', async_views.book_detail, name='async-book-detail'),
+    path('async/recommendations', async_views.recommendations, name='async-recommendations'),
 ]
\ No newline at end of file
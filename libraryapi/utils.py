@@ -1,25 +1,169 @@
-from sentence_transformers import SentenceTransformer
+import hashlib
+import logging
+import threading
+import time
+
 import numpy as np
+from django.conf import settings
 from django.db import models
+from django.db.models import Func, Value
+from django.db.models.functions import Concat
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+
+
+def _max_rss_bytes():
+    if resource is None:
+        return None
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of SentenceTransformer models.
+
+    Models are loaded lazily on first use and then shared by every request
+    handled by this worker. Loading and encoding are guarded by locks so the
+    registry can be used from threaded servers.
+    """
 
-class BookVectorizer:
     def __init__(self):
-        # Load a pre-trained model (you can choose an appropriate model)
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')  # Example model
+        self._models = {}
+        self._encode_locks = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        with self._lock:
+            # Another thread may have finished loading while we were waiting
+            model = self._models.get(name)
+            if model is None:
+                model = self._load(name)
+                self._encode_locks[name] = threading.Lock()
+                self._models[name] = model
+        return model
+
+    def encode_lock(self, name):
+        self.get(name)
+        return self._encode_locks[name]
+
+    def is_loaded(self, name):
+        return name in self._models
+
+    def stats(self):
+        return {name: dict(stats) for name, stats in self._stats.items()}
+
+    def _load(self, name):
+        # Imported here so that importing views or running manage.py commands
+        # doesn't pull in torch until a vector is actually needed
+        from sentence_transformers import SentenceTransformer
+
+        rss_before = _max_rss_bytes()
+        started = time.perf_counter()
+        model = SentenceTransformer(name)
+        load_seconds = time.perf_counter() - started
+        rss_after = _max_rss_bytes()
+
+        parameter_bytes = sum(p.numel() * p.element_size() for p in model.parameters())
+        self._stats[name] = {
+            'load_seconds': round(load_seconds, 3),
+            'parameter_bytes': parameter_bytes,
+            'max_rss_delta_bytes': (rss_after - rss_before) if rss_before is not None else None,
+        }
+        logger.info(
+            "Loaded embedding model %s in %.2fs (%.1f MB of parameters)",
+            name, load_seconds, parameter_bytes / (1024 * 1024),
+        )
+        return model
+
+
+registry = ModelRegistry()
+
+
+def content_hash(title, description):
+    # Hash of exactly the text BookVectorizer embeds, used to skip re-embedding unchanged books
+    return hashlib.sha256(f"{title} {description}".encode('utf-8')).hexdigest()
+
+
+class ContentHash(Func):
+    """content_hash() computed by Postgres, for finding stale rows in SQL."""
+    template = "encode(sha256(convert_to(%(expressions)s, 'UTF8')), 'hex')"
+    output_field = models.CharField()
+
+    def __init__(self, title='title', description='description', **extra):
+        super().__init__(Concat(title, Value(' '), description, output_field=models.TextField()), **extra)
+
+
+class BookVectorizer:
+    def __init__(self, model_name=None, dimensions=None):
+        self._model_name = model_name
+        self._dimensions = dimensions
+
+    @property
+    def model_name(self):
+        # Resolved lazily so the module can be imported before settings are configured
+        return self._model_name or getattr(settings, 'EMBEDDING_MODEL_NAME', DEFAULT_EMBEDDING_MODEL)
+
+    @property
+    def model(self):
+        return registry.get(self.model_name)
+
+    @property
+    def dimensions(self):
+        # Whatever model is configured has to produce vectors as wide as Book.vector.
+        # Processes without Django set up (ingestion workers) are given the width.
+        if self._dimensions is None:
+            from .models import Book
+            self._dimensions = Book._meta.get_field('vector').dimensions
+        return self._dimensions
+
+    def _checked(self, vectors):
+        if vectors.shape[-1] != self.dimensions:
+            raise ValueError(
+                f'{self.model_name} produces {vectors.shape[-1]}-dimensional vectors '
+                f'but Book.vector stores {self.dimensions}'
+            )
+        return vectors
 
     def generate_vector(self, title, description):
         # Combine title and description into one text
         text = f"{title} {description}"
-        
-        # Generate a vector using the model
-        vector = self.model.encode(text)
 
-        return vector
+        # Generate a vector using the shared model
+        with registry.encode_lock(self.model_name):
+            vector = self.model.encode(text)
 
-vectorizer = BookVectorizer()
+        return self._checked(vector)
+
+    def generate_query_vector(self, text):
+        # Free-text search queries are encoded as-is, without the title/description recipe
+        with registry.encode_lock(self.model_name):
+            return self._checked(self.model.encode(text))
 
+    def generate_vectors(self, titles, descriptions, batch_size=64):
+        # Same text recipe as generate_vector, encoded in batches in one call
+        texts = [f"{title} {description}" for title, description in zip(titles, descriptions)]
+        if not texts:
+            return np.empty((0, self.dimensions), dtype=np.float32)
+
+        with registry.encode_lock(self.model_name):
+            vectors = self.model.encode(texts, batch_size=batch_size, show_progress_bar=False)
+
+        return self._checked(vectors)
+
+vectorizer = BookVectorizer()
 
-from django.db.models import Func
 
 # Assuming vector is stored as an array in PostgreSQL
 class L2Distance(Func):
@@ -28,4 +172,4 @@ class L2Distance(Func):
     output_field = models.FloatField()
 
 def distance(vector1, vector2):
-    return np.linalg.norm(vector1 - vector2)
\ No newline at end of file
+    return np.linalg.norm(vector1 - vector2)
@@ -0,0 +1,290 @@
+"""
+Memory-mapped copy of Book.vector for answering similarity queries in the
+API workers instead of Postgres (settings.SIMILARITY_BACKEND = 'mmap').
+
+Layout of settings.VECTOR_STORE['PATH']::
+
+    CURRENT                  name of the active generation directory
+    lock                     flock()ed by writers
+    gen-<ns timestamp>/
+        manifest.json        count, dimensions, model
+        ids.npy              int64, sorted
+        vectors.npy          float32 (count x dimensions), row i is ids[i]
+        norms.npy            float32 squared L2 norm of each row
+        delta_ids.i64        raw int64, appended
+        delta_vectors.f32    raw float32 rows, appended
+        tombstones.i64       raw int64, appended
+
+``manage.py export_vectors`` writes a new generation from the database.
+Vectors written later (see libraryapi.embedding_queue) are appended to the
+delta files and deleted books to the tombstones, so readers stay current
+without a re-export. Every worker process maps the same files, so the
+matrix lives once in the page cache however many workers there are.
+
+Top-k uses ||x - q||^2 = ||x||^2 - 2 x.q + ||q||^2: one BLAS matrix-vector
+product over the whole matrix plus argpartition.
+"""
+import copy
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+CURRENT_FILE = 'CURRENT'
+LOCK_FILE = 'lock'
+DELTA_IDS = 'delta_ids.i64'
+DELTA_VECTORS = 'delta_vectors.f32'
+TOMBSTONES = 'tombstones.i64'
+
+
+class VectorStoreUnavailable(Exception):
+    pass
+
+
+def _read_array(path, dtype):
+    # Delta files only grow; a partially written trailing record is ignored
+    try:
+        size = os.path.getsize(path)
+    except FileNotFoundError:
+        return np.empty(0, dtype=dtype)
+    itemsize = np.dtype(dtype).itemsize
+    count = size // itemsize
+    if not count:
+        return np.empty(0, dtype=dtype)
+    return np.fromfile(path, dtype=dtype, count=count)
+
+
+def _delta_sizes(directory):
+    sizes = []
+    for name in (DELTA_IDS, DELTA_VECTORS, TOMBSTONES):
+        try:
+            sizes.append(os.path.getsize(os.path.join(directory, name)))
+        except FileNotFoundError:
+            sizes.append(0)
+    return tuple(sizes)
+
+
+class _Snapshot:
+    """One process's view of a generation plus the deltas seen so far."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'manifest.json')) as f:
+            self.manifest = json.load(f)
+        count = self.manifest['count']
+        self.dimensions = self.manifest['dimensions']
+        self.ids = np.load(os.path.join(directory, 'ids.npy'), mmap_mode='r')[:count]
+        self.vectors = np.load(os.path.join(directory, 'vectors.npy'), mmap_mode='r')[:count]
+        self.norms = np.load(os.path.join(directory, 'norms.npy'), mmap_mode='r')[:count]
+        self.delta_sizes = None
+        self.load_deltas()
+
+    def deltas_changed(self):
+        return _delta_sizes(self.directory) != self.delta_sizes
+
+    def load_deltas(self):
+        self.delta_sizes = _delta_sizes(self.directory)
+        delta_ids = _read_array(os.path.join(self.directory, DELTA_IDS), np.int64)
+        delta_vectors = _read_array(os.path.join(self.directory, DELTA_VECTORS), np.float32)
+        # Vectors are written before ids, so every id read has its vector
+        count = min(len(delta_ids), len(delta_vectors) // self.dimensions)
+        delta_ids = delta_ids[:count]
+        delta_vectors = delta_vectors[:count * self.dimensions].reshape(count, self.dimensions)
+
+        # Only the latest delta row of each book counts
+        reversed_unique, reversed_index = np.unique(delta_ids[::-1], return_index=True)
+        latest = count - 1 - reversed_index
+        self.delta_ids = reversed_unique
+        self.delta_vectors = delta_vectors[latest]
+        self.delta_norms = np.einsum('ij,ij->i', self.delta_vectors, self.delta_vectors)
+
+        self.tombstones = np.unique(_read_array(os.path.join(self.directory, TOMBSTONES), np.int64))
+        # Base rows replaced by a delta or deleted are never returned
+        self.base_mask = self.base_positions(np.concatenate([self.delta_ids, self.tombstones]))
+
+    def base_positions(self, book_ids):
+        book_ids = np.asarray(book_ids, dtype=np.int64)
+        positions = np.searchsorted(self.ids, book_ids)
+        positions = np.minimum(positions, max(len(self.ids) - 1, 0))
+        if not len(self.ids):
+            return positions[:0]
+        return positions[self.ids[positions] == book_ids]
+
+    def search(self, vector, k, exclude_ids=()):
+        query = np.asarray(vector, dtype=np.float32)
+        exclude_ids = np.asarray(list(exclude_ids), dtype=np.int64)
+
+        # ||x||^2 - 2 x.q; ||q||^2 is the same for every row and added back at the end
+        base_scores = self.norms - 2 * (self.vectors @ query)
+        base_scores[self.base_mask] = np.inf
+        base_scores[self.base_positions(exclude_ids)] = np.inf
+
+        delta_scores = self.delta_norms - 2 * (self.delta_vectors @ query)
+        delta_scores[np.isin(self.delta_ids, self.tombstones) | np.isin(self.delta_ids, exclude_ids)] = np.inf
+
+        scores = np.concatenate([base_scores, delta_scores])
+        ids = np.concatenate([self.ids, self.delta_ids])
+        k = min(k, int(np.isfinite(scores).sum()))
+        if k <= 0:
+            return [], []
+        top = np.argpartition(scores, k - 1)[:k]
+        top = top[np.argsort(scores[top], kind='stable')]
+        distances = np.sqrt(np.maximum(scores[top] + query @ query, 0))
+        return ids[top].tolist(), distances.tolist()
+
+
+class VectorStore:
+    """Reader and writer for one store directory; safe to share between threads."""
+
+    def __init__(self, path, refresh_seconds=5):
+        self.path = str(path)
+        self.refresh_seconds = refresh_seconds
+        self._snapshot = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+
+    # Reading
+
+    def _current_directory(self):
+        try:
+            with open(os.path.join(self.path, CURRENT_FILE)) as f:
+                return os.path.join(self.path, f.read().strip())
+        except FileNotFoundError:
+            raise VectorStoreUnavailable(f'No vector store at {self.path}; run manage.py export_vectors')
+
+    def _load_snapshot(self, directory):
+        while True:
+            try:
+                return _Snapshot(directory)
+            except FileNotFoundError:
+                # export_vectors removed the generation after we read CURRENT,
+                # which by now names the one that replaced it
+                current = self._current_directory()
+                if current == directory:
+                    raise VectorStoreUnavailable(f'Incomplete vector store generation at {directory}')
+                directory = current
+
+    def snapshot(self):
+        now = time.monotonic()
+        if self._snapshot is not None and now - self._checked_at < self.refresh_seconds:
+            return self._snapshot
+        with self._lock:
+            if self._snapshot is None or now - self._checked_at >= self.refresh_seconds:
+                directory = self._current_directory()
+                if self._snapshot is None or self._snapshot.directory != directory:
+                    self._snapshot = self._load_snapshot(directory)
+                elif self._snapshot.deltas_changed():
+                    # Searches in other threads keep using the old snapshot object
+                    snapshot = copy.copy(self._snapshot)
+                    snapshot.load_deltas()
+                    self._snapshot = snapshot
+                self._checked_at = now
+        return self._snapshot
+
+    def search(self, vector, limit=5, offset=0, exclude_ids=()):
+        """``(book_ids, l2_distances)`` of the closest books, closest first."""
+        ids, distances = self.snapshot().search(vector, offset + limit, exclude_ids)
+        return ids[offset:], distances[offset:]
+
+    # Writing
+
+    @contextmanager
+    def _locked(self):
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, LOCK_FILE), 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def append(self, book_ids, vectors):
+        """Record new or changed vectors for ``book_ids``."""
+        if not len(book_ids):
+            return
+        with self._locked():
+            directory = self._current_directory()
+            with open(os.path.join(directory, DELTA_VECTORS), 'ab') as f:
+                f.write(np.asarray(vectors, dtype=np.float32).tobytes())
+            with open(os.path.join(directory, DELTA_IDS), 'ab') as f:
+                f.write(np.asarray(book_ids, dtype=np.int64).tobytes())
+
+    def tombstone(self, book_ids):
+        """Record deleted books."""
+        if not len(book_ids):
+            return
+        with self._locked():
+            with open(os.path.join(self._current_directory(), TOMBSTONES), 'ab') as f:
+                f.write(np.asarray(book_ids, dtype=np.int64).tobytes())
+
+    def export(self, rows, count, dimensions, model_name=''):
+        """
+        Write a new generation from ``rows`` (``(book_id, vector)`` pairs in id
+        order, at most ``count`` of them) and make it current.
+
+        Deltas recorded while the export runs are carried over to the new
+        generation, so writes that race with the export are not lost.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        with self._locked():
+            try:
+                previous = self._current_directory()
+            except VectorStoreUnavailable:
+                previous = None
+            # Deltas past these offsets are newer than the rows exported below
+            start_sizes = _delta_sizes(previous) if previous else None
+
+        name = f'gen-{time.time_ns()}'
+        directory = os.path.join(self.path, name)
+        os.makedirs(directory)
+        ids = np.lib.format.open_memmap(os.path.join(directory, 'ids.npy'), mode='w+', dtype=np.int64, shape=(count,))
+        vectors = np.lib.format.open_memmap(
+            os.path.join(directory, 'vectors.npy'), mode='w+', dtype=np.float32, shape=(count, dimensions),
+        )
+        norms = np.lib.format.open_memmap(os.path.join(directory, 'norms.npy'), mode='w+', dtype=np.float32, shape=(count,))
+        written = 0
+        for book_id, vector in rows:
+            if written == count:
+                break
+            ids[written] = book_id
+            vectors[written] = vector
+            norms[written] = np.dot(vectors[written], vectors[written])
+            written += 1
+        for array in (ids, vectors, norms):
+            array.flush()
+        del ids, vectors, norms
+        with open(os.path.join(directory, 'manifest.json'), 'w') as f:
+            json.dump({'count': written, 'dimensions': dimensions, 'model': model_name}, f)
+
+        with self._locked():
+            if previous is not None:
+                for file_name, start in zip((DELTA_IDS, DELTA_VECTORS, TOMBSTONES), start_sizes):
+                    source = os.path.join(previous, file_name)
+                    if os.path.exists(source):
+                        with open(source, 'rb') as src, open(os.path.join(directory, file_name), 'wb') as dst:
+                            src.seek(start)
+                            shutil.copyfileobj(src, dst)
+            tmp_path = os.path.join(self.path, f'{CURRENT_FILE}.tmp')
+            with open(tmp_path, 'w') as f:
+                f.write(name)
+            os.replace(tmp_path, os.path.join(self.path, CURRENT_FILE))
+        return written, previous
+
+    def remove_generation(self, directory):
+        # Workers that still map the old files keep them alive until they refresh;
+        # ones that were about to open them re-read CURRENT (_load_snapshot)
+        shutil.rmtree(directory, ignore_errors=True)
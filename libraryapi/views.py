@@ -3,19 +3,68 @@ from rest_framework import generics, viewsets, permissions, status
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework_simplejwt.tokens import RefreshToken
-from .serializers import UserSerializer, AuthorSerializer, BookSerializer, UserFavoriteSerializer
+from .serializers import (
+    UserSerializer, AuthorSerializer, AuthorListSerializer, BookSerializer, BookListSerializer,
+    UserFavoriteSerializer,
+)
 from django.contrib.auth.models import User
-from .models import Author, UserFavorite, Book
-from django.db.models import Q
+from .models import Author, UserFavorite, Book, UserTasteProfile
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 from rest_framework.decorators import action
-from libraryapi.utils import BookVectorizer
-from pgvector.django import L2Distance
-import numpy as np
+from rest_framework.exceptions import NotFound, ValidationError
+from libraryapi.utils import content_hash
+from libraryapi.bulk import bulk_create_books, bulk_update_books
+from libraryapi.cache import CachedResponseMixin
+from libraryapi.embedding_queue import embedding_queue
+from libraryapi.favorites import MAX_FAVORITES, FavoriteLimitExceeded, add_favorites, remove_favorites
+from libraryapi.export import export_rows, gzip_chunks, ndjson_chunks, parse_updated_since
+from libraryapi.filters import BookFilterBackend, get_book_ordering, non_null_ordering_filters
+from libraryapi.pagination import RankedResultsPagination
+from libraryapi.search import hybrid_search, search_books
+from libraryapi.neighbors import precomputed_neighbors
+from libraryapi.similarity import nearest_books
 # from django.db.models.expressions import RawSQL
 # import json
 # from django.db import connection
 
 
+# Books per POST /api/books/similar/batch/ request
+MAX_SIMILAR_BATCH = 500
+
+# Books per POST/PATCH /api/books/bulk/ request
+MAX_BULK_BOOKS = 1000
+
+
+def get_limit_offset(request, default_limit=10, max_limit=100, max_offset=1000):
+    try:
+        limit = int(request.query_params.get('limit', default_limit))
+        offset = int(request.query_params.get('offset', 0))
+    except ValueError:
+        raise ValidationError({'detail': 'limit and offset must be integers'})
+    if limit < 1 or offset < 0:
+        raise ValidationError({'detail': 'limit must be positive and offset non-negative'})
+    limit = min(limit, max_limit)
+    # Nearest-neighbour scans can't reach past the index's ef_search cap
+    if offset + limit > max_offset:
+        raise ValidationError({'offset': f'offset + limit must be at most {max_offset}.'})
+    return limit, offset
+
+
+def get_book_ids(request, max_count):
+    """``(book_ids, error)`` from a ``book_ids`` list in the request body, deduplicated."""
+    book_ids = request.data.get('book_ids')
+    if not isinstance(book_ids, list) or not book_ids:
+        return None, 'book_ids must be a non-empty list'
+    if len(book_ids) > max_count:
+        return None, f'At most {max_count} book_ids per request'
+    try:
+        return list(dict.fromkeys(int(book_id) for book_id in book_ids)), None
+    except (TypeError, ValueError):
+        return None, 'book_ids must be integers'
+
+
 # Create your views here.
 class RegisterView(generics.CreateAPIView):
     queryset = User.objects.all()
@@ -38,76 +87,143 @@ class LoginView(generics.GenericAPIView):
             })  
         return Response({"detail": "Invalid credentials"}, status=400)
 
-class AuthorViewSet(viewsets.ModelViewSet):
+class AuthorViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     queryset = Author.objects.all()
     serializer_class = AuthorSerializer
+    cache_namespace = 'author'
 
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
     def get_permissions(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'books']:
             return [permissions.AllowAny()]
         return super().get_permissions()
 
-class BookViewSet(viewsets.ModelViewSet):
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return AuthorListSerializer
+        return super().get_serializer_class()
+
+    def get_keyset_ordering(self, request):
+        if self.action == 'books':
+            return get_book_ordering(request)
+        return ('-id',)
+
+    def get_queryset(self):
+        queryset = super().get_queryset().select_related('aggregate')
+        if self.action == 'list':
+            # Biographies are only shown on the detail page
+            queryset = queryset.defer('about')
+        return queryset
+
+    @action(detail=True, methods=['get'])
+    def books(self, request, pk=None):
+        """
+        The author's books, keyset paginated like /api/books/ (``?ordering=``
+        takes the same values). Served from the (author_id, book_id) index on
+        the link table.
+        """
+        if not str(pk).isdigit():
+            raise NotFound('No Author matches the given query.')
+        # Same non-null guard as BookFilterBackend for ?ordering=publication_date
+        ordering = self.get_keyset_ordering(request)
+        queryset = Book.objects.filter(authors=pk, **non_null_ordering_filters(Book, ordering))
+        queryset = queryset.defer('vector', 'description', 'search_vector').prefetch_related(
+            Prefetch('authors', queryset=Author.objects.only('id', 'name'))
+        )
+        page = self.paginate_queryset(queryset)
+        if not page and not request.query_params.get(self.paginator.cursor_query_param):
+            # Only an empty first page needs telling apart from an unknown author
+            if not Author.objects.filter(pk=pk).exists():
+                raise NotFound('No Author matches the given query.')
+        serializer = BookListSerializer(page, many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
+
+class BookViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     queryset = Book.objects.all()
     serializer_class = BookSerializer
+    cache_namespace = 'book'
+    # language, publisher, format, rating/count/date ranges; only indexed combinations
+    filter_backends = [BookFilterBackend]
     
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
     def get_permissions(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'similar', 'similar_batch']:
             return [permissions.AllowAny()]
+        if self.action == 'export':
+            return [IsAuthenticated()]
         return super().get_permissions()
     
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return BookListSerializer
+        return super().get_serializer_class()
+
+    def get_keyset_ordering(self, request):
+        return get_book_ordering(request)
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if self.request.query_params.get('search'):
+                # Relevance order has no stable key to page by
+                self._paginator = RankedResultsPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
     def get_queryset(self):
         queryset = super().get_queryset()
+        if self.action == 'list':
+            # None of these are part of the list representation
+            queryset = queryset.defer('vector', 'description', 'search_vector').prefetch_related(
+                Prefetch('authors', queryset=Author.objects.only('id', 'name'))
+            )
         search_query = self.request.query_params.get('search', None)
         if search_query:
-            queryset = queryset.filter(
-                Q(title__icontains=search_query) |
-                Q(authors__name__icontains=search_query)
-            ).distinct()
+            mode = self.request.query_params.get('mode', 'lexical')
+            if mode == 'hybrid':
+                # Full-text and vector candidates merged by reciprocal rank fusion
+                queryset, self.search_timings = hybrid_search(queryset, search_query)
+            elif mode == 'lexical':
+                # Ranked full-text match on title + author names, trigram fallback on title
+                queryset = search_books(queryset, search_query)
+            else:
+                raise ValidationError({'mode': "Expected 'lexical' or 'hybrid'."})
         return queryset
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        timings = getattr(self, 'search_timings', None)
+        if timings:
+            response['Server-Timing'] = ', '.join(f'{stage};dur={ms:.1f}' for stage, ms in timings.items())
+        return response
     
     def create(self, request, *args, **kwargs):
-        # Handle book creation
-        data = request.data
-        vectorizer = BookVectorizer()
-
-        # Extract title and description from the request
-        title = data.get('title', '')
-        description = data.get('description', '')
-
-        # Generate the vector using the title and description
-        vector = vectorizer.generate_vector(title, description)
-
-        # Create the book instance
-        serializer = self.get_serializer(data=data)
+        serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        serializer.save(vector=vector)
+        # The vector is computed in the background once the row is committed
+        book = serializer.save(vector_status=Book.VECTOR_PENDING)
+        embedding_queue.enqueue_on_commit([book.pk])
 
         headers = self.get_success_headers(serializer.data)
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
     def update(self, request, *args, **kwargs):
-        # Handle book update
         partial = kwargs.pop('partial', False)
         instance = self.get_object()
-        data = request.data
-        vectorizer = BookVectorizer()
-
-        # Extract title and description from the request
-        title = data.get('title', instance.title)
-        description = data.get('description', instance.description)
-
-        # Generate the vector using the title and description
-        vector = vectorizer.generate_vector(title, description)
-
-        # Update the book instance
-        serializer = self.get_serializer(instance, data=data, partial=partial)
+        serializer = self.get_serializer(instance, data=request.data, partial=partial)
         serializer.is_valid(raise_exception=True)
-        serializer.save(vector=vector)
+
+        title = serializer.validated_data.get('title', instance.title)
+        description = serializer.validated_data.get('description', instance.description)
+        if instance.vector is not None and content_hash(title, description) == instance.content_hash:
+            # Nothing the embedding depends on changed
+            serializer.save()
+        else:
+            serializer.save(vector_status=Book.VECTOR_PENDING)
+            embedding_queue.enqueue_on_commit([instance.pk])
 
         if getattr(instance, '_prefetched_objects_cache', None):
             # If 'prefetch_related' has been applied to a queryset, we need to reset the object cache.
@@ -115,49 +231,137 @@ class BookViewSet(viewsets.ModelViewSet):
 
         return Response(serializer.data)
 
+    @action(detail=False, methods=['post', 'patch'])
+    def bulk(self, request):
+        """
+        Create (POST) or partially update (PATCH, each item with an ``id``)
+        up to MAX_BULK_BOOKS books from a JSON list, with one result per item.
+        """
+        items = request.data
+        if not isinstance(items, list) or not items:
+            return Response({'error': 'Expected a non-empty list of books'}, status=400)
+        if len(items) > MAX_BULK_BOOKS:
+            return Response({'error': f'At most {MAX_BULK_BOOKS} books per request'}, status=400)
+
+        if request.method == 'POST':
+            results = bulk_create_books(items)
+            succeeded = status.HTTP_201_CREATED
+        else:
+            results = bulk_update_books(items)
+            succeeded = status.HTTP_200_OK
+        failed = sum(1 for result in results if result['status'] == 'error')
+        return Response(
+            {'succeeded': len(results) - failed, 'failed': failed, 'results': results},
+            status=succeeded if failed < len(results) else status.HTTP_400_BAD_REQUEST,
+        )
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        The whole catalogue (or the books changed since ``updated_since``) as
+        streamed NDJSON; ``?compression=gzip`` and ``?vectors=true`` are optional.
+        """
+        updated_since = request.query_params.get('updated_since')
+        if updated_since:
+            updated_since = parse_updated_since(updated_since)
+            if updated_since is None:
+                raise ValidationError({'updated_since': 'Expected an ISO 8601 date or datetime.'})
+        compression = request.query_params.get('compression')
+        if compression not in (None, 'gzip'):
+            raise ValidationError({'compression': "Expected 'gzip'."})
+        include_vectors = request.query_params.get('vectors') in ('1', 'true')
+
+        # Pass this back as updated_since next time to get everything changed since
+        started_at = timezone.now()
+        chunks = ndjson_chunks(export_rows(updated_since or None, include_vectors=include_vectors))
+        if compression == 'gzip':
+            response = StreamingHttpResponse(gzip_chunks(chunks), content_type='application/gzip')
+            response['Content-Disposition'] = 'attachment; filename="books.ndjson.gz"'
+        else:
+            response = StreamingHttpResponse(chunks, content_type='application/x-ndjson')
+        response['X-Export-Started-At'] = started_at.isoformat()
+        return response
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        limit, offset = get_limit_offset(request)
+        # Precomputed by precompute_similar_books; only books without a list need a vector query
+        precomputed = precomputed_neighbors([pk], limit=limit, offset=offset) if str(pk).isdigit() else {}
+        if precomputed:
+            return Response({'limit': limit, 'offset': offset, 'results': precomputed[int(pk)]})
+
+        book = self.get_object()
+        if book.vector is None:
+            return Response({'results': []})
+
+        similar_books = nearest_books(book.vector, exclude_ids=[book.id], limit=limit, offset=offset)
+        return Response({'limit': limit, 'offset': offset, 'results': similar_books})
+
+    @action(detail=False, methods=['post'], url_path='similar/batch')
+    def similar_batch(self, request):
+        book_ids, error = get_book_ids(request, MAX_SIMILAR_BATCH)
+        if error:
+            return Response({'error': error}, status=400)
+        limit, offset = get_limit_offset(request)
+
+        results = precomputed_neighbors(book_ids, limit=limit, offset=offset)
+        return Response({
+            'limit': limit,
+            'offset': offset,
+            'results': {str(book_id): results[book_id] for book_id in book_ids if book_id in results},
+            # No precomputed list yet (new book, or longer than what was stored); use /books/{id}/similar/
+            'missing': [book_id for book_id in book_ids if book_id not in results],
+        })
+
 
 class UserFavoriteViewSet(viewsets.ModelViewSet):
     serializer_class = UserFavoriteSerializer
     permission_classes = [IsAuthenticated]
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        # Same locked path as add_favorite so the cap holds here too
+        book = serializer.validated_data['book']
+        try:
+            add_favorites(self.request.user, [book.pk])
+        except FavoriteLimitExceeded as e:
+            raise ValidationError({'book': [str(e)]})
+        serializer.instance = UserFavorite.objects.get(user=self.request.user, book=book)
+
+    def perform_destroy(self, instance):
+        remove_favorites(instance.user, [instance.book_id])
 
     def get_queryset(self):
         # Only return favorites for the current user
         return UserFavorite.objects.filter(user=self.request.user)
 
+    def similar_to_profile(self, profile, limit=5):
+        if profile.vector is None:
+            return []
+        favorite_books = UserFavorite.objects.filter(user=profile.user_id).values_list('book', flat=True)
+        # Uses the ANN index on Book.vector instead of scanning every book
+        return nearest_books(profile.vector, exclude_ids=list(favorite_books), limit=limit)
+
     @action(detail=False, methods=['post'])
     def add_favorite(self, request):
-        user = request.user
         book_id = request.data.get('book_id')
         if not book_id:
             return Response({'error': 'Book ID is required'}, status=400)
-
-        if UserFavorite.objects.filter(user=user).count() >= 20:
-            return Response({'error': 'You can only have a maximum of 20 favorite books.'}, status=400)
-
-        book = Book.objects.filter(id=book_id).first()
-        if not book:
+        try:
+            book_id = int(book_id)
+        except (TypeError, ValueError):
+            return Response({'error': 'Book ID must be an integer'}, status=400)
+
+        try:
+            profile, added, _, missing = add_favorites(request.user, [book_id])
+        except FavoriteLimitExceeded as e:
+            return Response({'error': str(e)}, status=400)
+        if missing:
             return Response({'error': 'Book not found'}, status=404)
 
-        favorite, created = UserFavorite.objects.get_or_create(user=request.user, book=book)
-        if created:
-            # Get all favorite books of the user
-            favorite_books = UserFavorite.objects.filter(user=user).values_list('book', flat=True)
-            favorite_book_vectors = Book.objects.filter(id__in=favorite_books).values_list('vector', flat=True)
-
-            # Calculate the average vector of the favorite books
-            avg_vector = np.mean(favorite_book_vectors, axis=0)
-            similar_books = Book.objects.exclude(id__in=favorite_books).annotate(
-                similarity=L2Distance('vector', avg_vector)
-            ).order_by('similarity')[:5]
-            
-            # Create a list of dictionaries for the similar books
-            book_values = similar_books.values('id', 'title', 'similarity')            
+        if added:
             return Response({
                 'message': 'Book added to favorites',
-                'top_similar_books': book_values
+                'top_similar_books': self.similar_to_profile(profile)
             }, status=201)
 
         return Response({'message': 'Book is already in favorites'}, status=200)
@@ -167,14 +371,46 @@ class UserFavoriteViewSet(viewsets.ModelViewSet):
         book_id = request.data.get('book_id')
         if not book_id:
             return Response({'error': 'Book ID is required'}, status=400)
+        try:
+            book_id = int(book_id)
+        except (TypeError, ValueError):
+            return Response({'error': 'Book ID must be an integer'}, status=400)
 
-        favorite = UserFavorite.objects.filter(user=request.user, book_id=book_id).first()
-        if not favorite:
+        _, removed = remove_favorites(request.user, [book_id])
+        if not removed:
             return Response({'error': 'Favorite not found'}, status=404)
-
-        favorite.delete()
         return Response({'message': 'Book removed from favorites'}, status=204)
 
+    @action(detail=False, methods=['post'])
+    def bulk_add(self, request):
+        book_ids, error = get_book_ids(request, MAX_FAVORITES)
+        if error:
+            return Response({'error': error}, status=400)
+
+        # All or nothing: if the new books don't fit under the cap none are added
+        try:
+            profile, added, existing, missing = add_favorites(request.user, book_ids)
+        except FavoriteLimitExceeded as e:
+            return Response({'error': str(e)}, status=400)
+        return Response({
+            'added': added,
+            'already_favorites': existing,
+            'missing': missing,
+            'top_similar_books': self.similar_to_profile(profile) if added else [],
+        }, status=201 if added else 200)
+
+    @action(detail=False, methods=['post'])
+    def bulk_remove(self, request):
+        book_ids, error = get_book_ids(request, MAX_FAVORITES)
+        if error:
+            return Response({'error': error}, status=400)
+
+        _, removed = remove_favorites(request.user, book_ids)
+        return Response({
+            'removed': removed,
+            'not_favorites': [book_id for book_id in book_ids if book_id not in removed],
+        })
+
     @action(detail=False, methods=['get'])
     def list_favorites(self, request):
         favorites = self.get_queryset().select_related('book')
@@ -189,4 +425,18 @@ class UserFavoriteViewSet(viewsets.ModelViewSet):
             }
             for favorite in favorites
         ]
-        return Response(data)
\ No newline at end of file
+        return Response(data)
+
+
+class RecommendationView(generics.GenericAPIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        limit, offset = get_limit_offset(request)
+        profile = UserTasteProfile.objects.filter(user=request.user).first()
+        if profile is None or profile.vector is None:
+            return Response({'limit': limit, 'offset': offset, 'results': []})
+
+        favorite_books = UserFavorite.objects.filter(user=request.user).values_list('book', flat=True)
+        recommended_books = nearest_books(profile.vector, exclude_ids=list(favorite_books), limit=limit, offset=offset)
+        return Response({'limit': limit, 'offset': offset, 'results': recommended_books})
@@ -39,6 +39,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'libraryapi',
 ]
 
@@ -76,15 +77,51 @@ WSGI_APPLICATION = 'libraryassessment.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
+DB_POOL = config('DB_POOL', default=False, cast=bool)
+
+
+def _database(pool_min_size, pool_max_size):
+    database = {
         'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'library_assessment',
-        'USER': 'postgres',
-        'PASSWORD': 'postgres',
-        'HOST': 'localhost',  # Set to your database server's address
-        'PORT': '5432',       # Default PostgreSQL port
+        'NAME': config('DB_NAME', default='library_assessment'),
+        'USER': config('DB_USER', default='postgres'),
+        'PASSWORD': config('DB_PASSWORD', default='postgres'),
+        'HOST': config('DB_HOST', default='localhost'),  # Set to your database server's address
+        'PORT': config('DB_PORT', default='5432'),       # Default PostgreSQL port
     }
+    if DB_POOL:
+        # psycopg 3 connection pool (needs psycopg[pool]); connections are
+        # handed back on close instead of being torn down. Django doesn't
+        # allow this together with persistent connections.
+        database['OPTIONS'] = {
+            'pool': {
+                'min_size': pool_min_size,
+                'max_size': pool_max_size,
+                'timeout': config('DB_POOL_TIMEOUT', default=10, cast=float),
+            },
+        }
+    else:
+        # Keep connections open between requests, checking them before reuse
+        database['CONN_MAX_AGE'] = config('DB_CONN_MAX_AGE', default=60, cast=int)
+        database['CONN_HEALTH_CHECKS'] = True
+    return database
+
+
+DATABASES = {
+    # API workers: many short queries
+    'default': _database(
+        config('DB_POOL_MIN_SIZE', default=2, cast=int),
+        config('DB_POOL_MAX_SIZE', default=10, cast=int),
+    ),
+    # Seed commands (--database ingest): few long-running transactions,
+    # kept apart so a load can't starve the API of connections
+    'ingest': dict(
+        _database(
+            config('DB_INGEST_POOL_MIN_SIZE', default=1, cast=int),
+            config('DB_INGEST_POOL_MAX_SIZE', default=4, cast=int),
+        ),
+        TEST={'MIRROR': 'default'},
+    ),
 }
 
 
@@ -133,7 +170,7 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'libraryapi.pagination.KeysetPagination',
     'PAGE_SIZE': 20,  
 }
 # APPEND_SLASH=False
@@ -144,4 +181,83 @@ SIMPLE_JWT = {
     'BLACKLIST_AFTER_ROTATION': True,
     'ALGORITHM': 'HS256',
     'SIGNING_KEY': config('SECRET_KEY'),
-}
\ No newline at end of file
+}
+
+# Sentence-transformers model used for Book.vector. Loaded once per process on first use.
+EMBEDDING_MODEL_NAME = config('EMBEDDING_MODEL_NAME', default='all-MiniLM-L6-v2')
+
+# Background embedding of API writes (libraryapi.embedding_queue)
+EMBEDDING_QUEUE = {
+    'WORKERS': config('EMBEDDING_QUEUE_WORKERS', default=1, cast=int),
+    'BATCH_SIZE': config('EMBEDDING_QUEUE_BATCH_SIZE', default=32, cast=int),
+    # How long a worker waits for more ids before encoding a partial batch
+    'MAX_WAIT_MS': config('EMBEDDING_QUEUE_MAX_WAIT_MS', default=50, cast=int),
+}
+
+# Approximate nearest-neighbour index on Book.vector (migration 0013, build_vector_index).
+# EF_SEARCH / PROBES are applied per query by libraryapi.similarity.ann_search.
+VECTOR_INDEX = {
+    'METHOD': config('VECTOR_INDEX_METHOD', default='hnsw'),  # 'hnsw' or 'ivfflat'
+    'HNSW_M': config('VECTOR_HNSW_M', default=16, cast=int),
+    'HNSW_EF_CONSTRUCTION': config('VECTOR_HNSW_EF_CONSTRUCTION', default=64, cast=int),
+    'IVFFLAT_LISTS': config('VECTOR_IVFFLAT_LISTS', default=1000, cast=int),
+    'EF_SEARCH': config('VECTOR_EF_SEARCH', default=40, cast=int),
+    'PROBES': config('VECTOR_PROBES', default=10, cast=int),
+    # Index a compact form of the vector: 'none', 'halfvec' (2x smaller) or 'binary' (32x).
+    # Change it together with `manage.py build_vector_index --quantization ...`.
+    'QUANTIZATION': config('VECTOR_QUANTIZATION', default='none'),
+    # Books fetched from a quantized index and re-ranked with full-precision vectors
+    'RERANK_CANDIDATES': config('VECTOR_RERANK_CANDIDATES', default=100, cast=int),
+}
+
+# Incremental exports (libraryapi.export) also resend rows stamped this many
+# seconds before updated_since; must exceed the longest write transaction
+EXPORT_UPDATED_SINCE_MARGIN = config('EXPORT_UPDATED_SINCE_MARGIN', default=600, cast=int)
+
+# Threads that embed search queries for the async views (libraryapi.async_views)
+ASYNC_EMBEDDING_WORKERS = config('ASYNC_EMBEDDING_WORKERS', default=2, cast=int)
+
+# Where nearest_books() runs: 'postgres' (the ANN index) or 'mmap', a memory-mapped
+# copy of the vectors searched in the API workers (libraryapi.vector_store,
+# written by `manage.py export_vectors`).
+SIMILARITY_BACKEND = config('SIMILARITY_BACKEND', default='postgres')
+VECTOR_STORE = {
+    'PATH': config('VECTOR_STORE_PATH', default=str(BASE_DIR / 'vector_store')),
+    # How often workers look for appended deltas or a new export
+    'REFRESH_SECONDS': config('VECTOR_STORE_REFRESH_SECONDS', default=5, cast=float),
+}
+
+# GET /api/books/?search=...&mode=hybrid (libraryapi.search.hybrid_search)
+HYBRID_SEARCH = {
+    'CANDIDATES': config('HYBRID_SEARCH_CANDIDATES', default=100, cast=int),  # per retriever
+    'RRF_K': config('HYBRID_SEARCH_RRF_K', default=60, cast=int),
+    'QUERY_CACHE_SIZE': config('HYBRID_SEARCH_QUERY_CACHE_SIZE', default=1024, cast=int),
+}
+
+# Cache backend: 'locmem' (per-process LRU) or 'redis' (shared, any Redis-compatible server)
+CACHE_BACKEND = config('CACHE_BACKEND', default='locmem')
+if CACHE_BACKEND == 'redis':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': config('CACHE_URL', default='redis://127.0.0.1:6379/1'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', default=10000, cast=int)},
+        }
+    }
+
+# Book/author list and detail responses (libraryapi.cache); invalidated by signals on write
+RESPONSE_CACHE = {
+    'ALIAS': 'default',
+    'TIMEOUT': config('RESPONSE_CACHE_TIMEOUT', default=300, cast=int),
+    # Whether every process (API workers and management commands) sees the same
+    # cache. If not, as with locmem, a write only invalidates its own worker's
+    # copies, so bodies are kept for LOCAL_TIMEOUT seconds instead of TIMEOUT
+    'SHARED': config('RESPONSE_CACHE_SHARED', default=CACHE_BACKEND == 'redis', cast=bool),
+    'LOCAL_TIMEOUT': config('RESPONSE_CACHE_LOCAL_TIMEOUT', default=5, cast=int),
+}